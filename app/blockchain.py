@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import heapq
 import json
+import threading
+import time
 from datetime import datetime, date
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Dict, List, Set, Tuple
 
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from web3.middleware.proof_of_authority import ExtraDataToPOAMiddleware
 
 from .config import settings
@@ -57,46 +62,234 @@ if _w3 is not None and settings.polygon_private_key:
     _SENDER_ADDRESS = _w3.eth.account.from_key(settings.polygon_private_key).address
 
 
-def _send_tx(fn, **fn_kwargs: Any) -> str:
-    """Build, sign and send a transaction. Returns tx hash (or empty string).
+class ChainNotConfigured(RuntimeError):
+    """Polygon config or ABI is missing, so nothing can be sent."""
 
-    If config is missing, this becomes a no-op but logs to console.
+
+def is_configured() -> bool:
+    return _w3 is not None and _contract is not None and _SENDER_ADDRESS is not None
+
+
+class NonceManager:
+    """In-process nonce allocator for one sender key.
+
+    Nonces are handed out sequentially under a lock, so concurrent senders
+    never collide and no transaction pays a get_transaction_count round
+    trip. Nonces of transactions that failed before reaching the node are
+    reused. The counter is resynced from the chain's "pending" tag on first
+    use, after a "nonce too low" error, and when idle for
+    settings.chain_nonce_resync_seconds (to close gaps left by transactions
+    the node dropped).
     """
 
+    def __init__(self, w3: Web3, address: str) -> None:
+        self._w3 = w3
+        self._address = address
+        self._lock = threading.Lock()
+        self._next: int | None = None
+        self._released: List[int] = []  # min-heap of nonces to reuse
+        self._in_flight: Set[int] = set()  # allocated, send outcome not known yet
+        self._synced_at = 0.0
+
+    def _resync_locked(self) -> None:
+        chain_next = self._w3.eth.get_transaction_count(self._address, "pending")
+        mined = self._w3.eth.get_transaction_count(self._address, "latest")
+        if self._next is None or not self._in_flight:
+            self._next = chain_next
+            self._released = []
+        else:
+            # Nonces still in flight below chain_next will fail as too low and be retried
+            self._next = max(self._next, chain_next)
+            self._released = [n for n in self._released if n >= chain_next]
+            heapq.heapify(self._released)
+        self._synced_at = time.monotonic()
+        print(f"[BC] Nonce resync: next {self._next}, {chain_next - mined} pending tx(s) in the node's pool")
+
+    def allocate(self) -> int:
+        with self._lock:
+            idle = not self._in_flight and not self._released
+            if self._next is None or (
+                idle and time.monotonic() - self._synced_at > settings.chain_nonce_resync_seconds
+            ):
+                self._resync_locked()
+            if self._released:
+                nonce = heapq.heappop(self._released)
+            else:
+                nonce = self._next
+                self._next += 1
+            self._in_flight.add(nonce)
+            return nonce
+
+    def sent(self, nonce: int) -> None:
+        with self._lock:
+            self._in_flight.discard(nonce)
+
+    def failed(self, nonce: int, consumed: bool) -> None:
+        """The send failed; `consumed` means the chain already has this nonce (resync)."""
+        with self._lock:
+            self._in_flight.discard(nonce)
+            if consumed:
+                self._resync_locked()
+            elif self._next is not None and nonce == self._next - 1:
+                self._next = nonce
+            else:
+                heapq.heappush(self._released, nonce)
+
+
+@lru_cache(maxsize=1)
+def _nonce_manager() -> NonceManager:
+    return NonceManager(_w3, _SENDER_ADDRESS)  # type: ignore[arg-type]
+
+
+@lru_cache(maxsize=1)
+def _chain_id() -> int:
+    # Passed to build_transaction so it does not ask the node on every transaction
+    return _w3.eth.chain_id  # type: ignore[union-attr]
+
+
+def _nonce_error(exc: Exception) -> str | None:
+    message = str(exc).lower()
+    if "already known" in message:
+        return "already_known"  # this exact transaction is in the pool already
+    if "nonce too low" in message or "replacement transaction underpriced" in message:
+        return "consumed"
+    return None
+
+
+def _tx_params(nonce: int, gas: int = 500_000) -> Dict[str, Any]:
+    # Note: Polygon Amoy currently enforces a minimum priority fee (~25 gwei),
+    # so we set a comfortably higher tip and max fee for reliability.
+    return {
+        "from": _SENDER_ADDRESS,
+        "nonce": nonce,
+        "chainId": _chain_id(),
+        "gas": gas,
+        "maxFeePerGas": _w3.to_wei("60", "gwei"),
+        "maxPriorityFeePerGas": _w3.to_wei("30", "gwei"),
+    }
+
+
+def _sign_and_send(build_tx: Callable[[int], Dict[str, Any]], label: str) -> str:
+    """Sign and send the transaction built for an allocated nonce. Returns the tx hash; raises on failure."""
+    if not is_configured():
+        raise ChainNotConfigured(f"Blockchain not configured, cannot send {label}")
+
+    nonces = _nonce_manager()
+    retried = False
+    while True:
+        nonce = nonces.allocate()
+        signed = None
+        try:
+            signed = _w3.eth.account.sign_transaction(build_tx(nonce), private_key=settings.polygon_private_key)
+            # web3 v7 uses snake_case raw_transaction instead of rawTransaction
+            raw_tx = getattr(signed, "raw_transaction", getattr(signed, "rawTransaction", None))
+            if raw_tx is None:
+                raise RuntimeError("SignedTransaction has no raw_transaction field")
+            hex_hash = _w3.eth.send_raw_transaction(raw_tx).hex()
+        except Exception as exc:
+            kind = _nonce_error(exc)
+            if kind == "already_known" and signed is not None:
+                hex_hash = signed.hash.hex()
+            else:
+                nonces.failed(nonce, consumed=kind == "consumed")
+                if kind == "consumed" and not retried:
+                    retried = True  # one retry with a fresh nonce after "nonce too low"
+                    continue
+                raise
+        nonces.sent(nonce)
+        print("[BC] Sent tx", label, hex_hash, "nonce", nonce)
+        return hex_hash
+
+
+def _submit_tx(fn, **fn_kwargs: Any) -> str:
+    """Build, sign and send a contract call. Returns the tx hash; raises on any failure."""
+
     # Derive a safe name for logging; web3 v7 may not expose function_identifier
     fn_name = getattr(fn, "function_identifier", getattr(fn, "fn_name", "<unknown_fn>"))
+    return _sign_and_send(lambda nonce: fn(**fn_kwargs).build_transaction(_tx_params(nonce)), fn_name)
 
-    if _w3 is None or _contract is None or _SENDER_ADDRESS is None:
-        print("[BC] Blockchain not configured, skipping tx", fn_name)
-        return ""
 
+# Anchor transactions carry ANCHOR_PREFIX + a 32-byte Merkle root as calldata of a
+# zero-value transfer to the sender itself: no contract change, ~22k gas each.
+ANCHOR_PREFIX = b"AGRI-ANCHOR-v1:"
+
+
+def send_anchor(root: bytes) -> str:
+    """Publish a Merkle root on-chain. Returns the tx hash; raises on failure."""
+    if len(root) != 32:
+        raise ValueError("Merkle root must be 32 bytes")
+
+    def build(nonce: int) -> Dict[str, Any]:
+        return {
+            **_tx_params(nonce, gas=settings.chain_anchor_gas),
+            "to": _SENDER_ADDRESS,
+            "value": 0,
+            "data": ANCHOR_PREFIX + root,
+        }
+
+    return _sign_and_send(build, "anchor")
+
+
+def fetch_receipt(tx_hash: str) -> Tuple[str, int | None]:
+    """(status, block number) of a sent transaction.
+
+    Status is "confirmed" or "reverted" once mined, "pending" while the node
+    still knows the transaction, and "missing" if it was dropped.
+    """
+    if _w3 is None:
+        raise ChainNotConfigured("Blockchain not configured, cannot read receipts")
     try:
-        nonce = _w3.eth.get_transaction_count(_SENDER_ADDRESS)
-        # Note: Polygon Amoy currently enforces a minimum priority fee (~25 gwei),
-        # so we set a comfortably higher tip and max fee for reliability.
-        tx = fn(**fn_kwargs).build_transaction(
-            {
-                "from": _SENDER_ADDRESS,
-                "nonce": nonce,
-                "gas": 500_000,
-                "maxFeePerGas": _w3.to_wei("60", "gwei"),
-                "maxPriorityFeePerGas": _w3.to_wei("30", "gwei"),
-            }
-        )
-        signed = _w3.eth.account.sign_transaction(tx, private_key=settings.polygon_private_key)
-        # web3 v7 uses snake_case raw_transaction instead of rawTransaction
-        raw_tx = getattr(signed, "raw_transaction", getattr(signed, "rawTransaction", None))
-        if raw_tx is None:
-            raise RuntimeError("SignedTransaction has no raw_transaction field")
-        tx_hash = _w3.eth.send_raw_transaction(raw_tx)
-        hex_hash = tx_hash.hex()
-        print("[BC] Sent tx", fn_name, hex_hash)
-        return hex_hash
+        receipt = _w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        receipt = None
+    if receipt is not None:
+        return ("confirmed" if receipt["status"] == 1 else "reverted"), receipt["blockNumber"]
+    try:
+        _w3.eth.get_transaction(tx_hash)
+    except TransactionNotFound:
+        return "missing", None
+    return "pending", None
+
+
+def read_anchor(tx_hash: str) -> str | None:
+    """Merkle root (0x-hex) published by an anchor transaction, or None if it is not one."""
+    if _w3 is None:
+        raise ChainNotConfigured("Blockchain not configured, cannot read anchors")
+    data = bytes(_w3.eth.get_transaction(tx_hash)["input"])
+    if not data.startswith(ANCHOR_PREFIX) or len(data) != len(ANCHOR_PREFIX) + 32:
+        return None
+    return Web3.to_hex(data[len(ANCHOR_PREFIX) :])
+
+
+def _send_tx(fn, **fn_kwargs: Any) -> str:
+    """Fail-soft _submit_tx. Returns tx hash (or empty string).
+
+    If config is missing, this becomes a no-op but logs to console.
+    """
+    try:
+        return _submit_tx(fn, **fn_kwargs)
+    except ChainNotConfigured as exc:
+        print("[BC]", exc)
+        return ""
     except Exception as exc:  # pragma: no cover - integration / network errors
+        fn_name = getattr(fn, "function_identifier", getattr(fn, "fn_name", "<unknown_fn>"))
         print("[BC] Error sending tx", fn_name, exc)
         return ""
 
 
+# (contract function name, keyword arguments) of one on-chain event; JSON-serializable
+# so it can be stored in the outbox and sent later.
+ChainEvent = Tuple[str, Dict[str, Any]]
+
+
+def send_chain_event(event: ChainEvent) -> str:
+    """Send one event. Returns the tx hash; raises ChainNotConfigured or the RPC error."""
+    if _contract is None:
+        raise ChainNotConfigured("Contract not ready")
+    function_name, kwargs = event
+    return _submit_tx(getattr(_contract.functions, function_name), **kwargs)
+
+
 # --- Helper functions called from routers / repositories --------------------
 
 
@@ -108,28 +301,119 @@ def _to_timestamp(dt: datetime | date | None) -> int:
     return int(datetime.utcnow().timestamp())
 
 
-def bc_record_batch_created(
+def batch_created_event(
     batch_id: str,
     crop_name: str,
     quantity_kg: float,
     harvest_dt: datetime | date | None,
     image_url: str | None,
-) -> str:
-    """Blockchain log for: farmer creates a new batch."""
+) -> ChainEvent:
+    """Event for: farmer creates a new batch."""
+    return (
+        "recordBatchCreated",
+        {
+            "batchId": batch_id,
+            "cropName": crop_name,
+            "quantityKg": int(quantity_kg),
+            "harvestDate": _to_timestamp(harvest_dt),
+            "imageUrl": image_url or "",
+        },
+    )
+
+
+def ai_quality_event(
+    batch_id: str,
+    freshness: str,
+    spoilage: str,
+    damage: str,
+    confidence: float,
+) -> ChainEvent:
+    """Event for: AI quality check completed."""
+    return (
+        "recordAIQuality",
+        {
+            "batchId": batch_id,
+            "freshness": freshness,
+            "spoilage": spoilage,
+            "damage": damage,
+            "confidence": int(confidence * 100),  # assume 0.0-1.0 -> 0-100
+        },
+    )
+
+
+def pickup_event(
+    batch_id: str,
+    pickup_dt: datetime,
+    vehicle_number: str,
+    destination: str,
+) -> ChainEvent:
+    """Event for: distributor pickup confirmation."""
+    return (
+        "recordPickup",
+        {
+            "batchId": batch_id,
+            "pickupTime": _to_timestamp(pickup_dt),
+            "vehicleNumber": vehicle_number,
+            "destination": destination,
+        },
+    )
 
+
+def delivery_event(
+    batch_id: str,
+    arrival_dt: datetime,
+    retailer_id_or_name: str,
+) -> ChainEvent:
+    """Event for: distributor delivery confirmation."""
+    return (
+        "recordDelivery",
+        {
+            "batchId": batch_id,
+            "arrivalTime": _to_timestamp(arrival_dt),
+            "retailerIdOrName": retailer_id_or_name,
+        },
+    )
+
+
+def retailer_price_event(
+    batch_id: str,
+    original_price: float,
+    discount_percent: float,
+    final_price: float,
+) -> ChainEvent:
+    """Event for: retailer sets / updates selling price."""
+    return (
+        "recordRetailerPrice",
+        {
+            "batchId": batch_id,
+            "originalPricePerKg": int(original_price * 100),
+            "discountPercent": int(discount_percent),
+            "finalPricePerKg": int(final_price * 100),
+        },
+    )
+
+
+# Synchronous, fail-soft variants. Request handlers enqueue events in the
+# outbox instead (see app.chain_outbox) so they never wait on the chain.
+
+
+def _record(event: ChainEvent) -> str:
     if _contract is None:
-        print("[BC] Contract not ready, skip batch_created")
+        print("[BC] Contract not ready, skip", event[0])
         return ""
+    function_name, kwargs = event
+    return _send_tx(getattr(_contract.functions, function_name), **kwargs)
 
-    fn = _contract.functions.recordBatchCreated
-    return _send_tx(
-        fn,
-        batchId=batch_id,
-        cropName=crop_name,
-        quantityKg=int(quantity_kg),
-        harvestDate=_to_timestamp(harvest_dt),
-        imageUrl=image_url or "",
-    )
+
+def bc_record_batch_created(
+    batch_id: str,
+    crop_name: str,
+    quantity_kg: float,
+    harvest_dt: datetime | date | None,
+    image_url: str | None,
+) -> str:
+    """Blockchain log for: farmer creates a new batch."""
+    return _record(batch_created_event(batch_id, crop_name, quantity_kg, harvest_dt, image_url))
 
 
 def bc_record_ai_quality(
@@ -140,20 +424,7 @@ def bc_record_ai_quality(
     confidence: float,
 ) -> str:
     """Blockchain log for: AI quality check completed."""
-
-    if _contract is None:
-        print("[BC] Contract not ready, skip ai_quality")
-        return ""
-
-    fn = _contract.functions.recordAIQuality
-    return _send_tx(
-        fn,
-        batchId=batch_id,
-        freshness=freshness,
-        spoilage=spoilage,
-        damage=damage,
-        confidence=int(confidence * 100),  # assume 0.0-1.0 -> 0-100
-    )
+    return _record(ai_quality_event(batch_id, freshness, spoilage, damage, confidence))
 
 
 def bc_record_pickup(
@@ -163,19 +434,7 @@ def bc_record_pickup(
     destination: str,
 ) -> str:
     """Blockchain log for: distributor pickup confirmation."""
-
-    if _contract is None:
-        print("[BC] Contract not ready, skip pickup")
-        return ""
-
-    fn = _contract.functions.recordPickup
-    return _send_tx(
-        fn,
-        batchId=batch_id,
-        pickupTime=_to_timestamp(pickup_dt),
-        vehicleNumber=vehicle_number,
-        destination=destination,
-    )
+    return _record(pickup_event(batch_id, pickup_dt, vehicle_number, destination))
 
 
 def bc_record_delivery(
@@ -184,18 +443,7 @@ def bc_record_delivery(
     retailer_id_or_name: str,
 ) -> str:
     """Blockchain log for: distributor delivery confirmation."""
-
-    if _contract is None:
-        print("[BC] Contract not ready, skip delivery")
-        return ""
-
-    fn = _contract.functions.recordDelivery
-    return _send_tx(
-        fn,
-        batchId=batch_id,
-        arrivalTime=_to_timestamp(arrival_dt),
-        retailerIdOrName=retailer_id_or_name,
-    )
+    return _record(delivery_event(batch_id, arrival_dt, retailer_id_or_name))
 
 
 def bc_record_retailer_price(
@@ -205,16 +453,72 @@ def bc_record_retailer_price(
     final_price: float,
 ) -> str:
     """Blockchain log for: retailer sets / updates selling price."""
+    return _record(retailer_price_event(batch_id, original_price, discount_percent, final_price))
 
-    if _contract is None:
-        print("[BC] Contract not ready, skip retailer_price")
-        return ""
 
-    fn = _contract.functions.recordRetailerPrice
-    return _send_tx(
-        fn,
-        batchId=batch_id,
-        originalPricePerKg=int(original_price * 100),
-        discountPercent=int(discount_percent),
-        finalPricePerKg=int(final_price * 100),
-    )
+# --- Reading contract activity back (used by app.chain_indexer) ---------------
+
+
+def head_block() -> int:
+    if _w3 is None:
+        raise ChainNotConfigured("Blockchain not configured")
+    return _w3.eth.block_number
+
+
+def block_hash(number: int) -> str:
+    if _w3 is None:
+        raise ChainNotConfigured("Blockchain not configured")
+    return Web3.to_hex(_w3.eth.get_block(number)["hash"])
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return Web3.to_hex(value)
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+def fetch_contract_events(from_block: int, to_block: int) -> List[Dict[str, Any]]:
+    """Logs emitted by the AgriChain contract in [from_block, to_block], decoded.
+
+    Logs matching an event in the ABI are decoded from the log itself; other
+    logs are attributed to the contract call that emitted them, decoded from
+    the transaction input with the ABI's functions.
+    """
+    if _w3 is None or _contract is None:
+        raise ChainNotConfigured("Blockchain not configured")
+    events_by_topic = {
+        Web3.to_hex(Web3.keccak(text=f"{e['name']}({','.join(i['type'] for i in e['inputs'])})")): e["name"]
+        for e in _contract.abi
+        if e.get("type") == "event"
+    }
+    logs = _w3.eth.get_logs({"address": _contract.address, "fromBlock": from_block, "toBlock": to_block})
+    calls: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    decoded: List[Dict[str, Any]] = []
+    for log in logs:
+        tx_hash = Web3.to_hex(log["transactionHash"])
+        topics = [Web3.to_hex(t) for t in log["topics"]]
+        name = events_by_topic.get(topics[0]) if topics else None
+        if name is not None:
+            args = dict(getattr(_contract.events, name)().process_log(log)["args"])
+        else:
+            if tx_hash not in calls:
+                fn, call_args = _contract.decode_function_input(_w3.eth.get_transaction(tx_hash)["input"])
+                calls[tx_hash] = (fn.fn_name, dict(call_args))
+            name, args = calls[tx_hash]
+        decoded.append(
+            {
+                "block_number": log["blockNumber"],
+                "block_hash": Web3.to_hex(log["blockHash"]),
+                "tx_hash": tx_hash,
+                "log_index": log["logIndex"],
+                "name": name,
+                "args": _jsonable(args),
+                "topics": topics,
+                "data": Web3.to_hex(log["data"]),
+            }
+        )
+    return decoded
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+from web3 import Web3
+
+
+# Merkle anchoring of chain events (settings.chain_mode == "anchored"): the
+# outbox worker hashes a window of events into a tree, sends only the root
+# (see blockchain.send_anchor) and stores each event's inclusion proof in
+# chain_anchor_proofs; chain_verify.verify_batch checks them with verify_inclusion.
+# Leaves and inner nodes are domain-separated (0x00 / 0x01 prefixes) so an
+# inner node can never be passed off as an event.
+
+# (sibling hash as 0x-hex, side of the sibling: "L" or "R"), ordered from leaf to root
+ProofStep = Tuple[str, str]
+
+
+def canonical_event(function_name: str, payload: Dict[str, Any]) -> bytes:
+    """Stable byte encoding of an event: sorted-key compact JSON."""
+    return json.dumps(
+        {"fn": function_name, "args": payload}, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def leaf_hash(function_name: str, payload: Dict[str, Any]) -> bytes:
+    return bytes(Web3.keccak(b"\x00" + canonical_event(function_name, payload)))
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    return bytes(Web3.keccak(b"\x01" + left + right))
+
+
+def build_merkle_tree(leaves: Sequence[bytes]) -> Tuple[bytes, List[List[ProofStep]]]:
+    """Root and one inclusion proof per leaf. A last odd node is carried up to the next level unchanged."""
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+    proofs: List[List[ProofStep]] = [[] for _ in leaves]
+    level = list(leaves)
+    members = [[i] for i in range(len(leaves))]  # leaf indexes under each node of the level
+    while len(level) > 1:
+        next_level: List[bytes] = []
+        next_members: List[List[int]] = []
+        for i in range(0, len(level), 2):
+            if i + 1 == len(level):
+                next_level.append(level[i])
+                next_members.append(members[i])
+                continue
+            left, right = level[i], level[i + 1]
+            for leaf in members[i]:
+                proofs[leaf].append((Web3.to_hex(right), "R"))
+            for leaf in members[i + 1]:
+                proofs[leaf].append((Web3.to_hex(left), "L"))
+            next_level.append(_node_hash(left, right))
+            next_members.append(members[i] + members[i + 1])
+        level, members = next_level, next_members
+    return level[0], proofs
+
+
+def verify_inclusion(function_name: str, payload: Dict[str, Any], proof: Sequence[ProofStep], root: str) -> bool:
+    """Check that an event is covered by an anchored Merkle root (0x-hex)."""
+    node = leaf_hash(function_name, payload)
+    for sibling, side in proof:
+        sibling_bytes = bytes(Web3.to_bytes(hexstr=sibling))
+        node = _node_hash(sibling_bytes, node) if side == "L" else _node_hash(node, sibling_bytes)
+    return Web3.to_hex(node) == root.lower()
+
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .blockchain import block_hash, fetch_contract_events, head_block, is_configured
+from .config import settings
+from .database import SessionLocal
+from .db_models import ChainCheckpointDB, ChainEventDB, ChainLeaseDB
+
+
+# Reads the AgriChain contract's logs back into chain_events so trace queries
+# are served from SQL. Blocks are scanned in windows with eth_getLogs and the
+# last scanned block is checkpointed, so a restart resumes where it stopped.
+# Every pass re-scans the last chain_indexer_confirmations blocks (replacing
+# their rows), which absorbs ordinary reorgs; if the checkpointed block itself
+# was reorged away, the indexer steps back to the newest earlier checkpoint
+# whose block hash still matches the chain and re-scans from there.
+# The app starts the indexer in every worker process; a lease row in
+# chain_leases lets only one of them scan, and another takes over once it
+# stops renewing it.
+
+CHECKPOINT = "agrichain"
+
+
+def _range_too_large(exc: Exception) -> bool:
+    message = str(exc).lower()
+    return any(s in message for s in ("more than", "too many", "range", "limit exceeded", "response size"))
+
+
+def _acquire_lease(db: Session, owner: str) -> bool:
+    """Take or renew the indexer lease; False while another process holds it."""
+    now = datetime.utcnow()
+    locked_until = now + timedelta(seconds=settings.chain_indexer_lease_seconds)
+    renewed = (
+        db.query(ChainLeaseDB)
+        .filter(
+            ChainLeaseDB.name == CHECKPOINT,
+            (ChainLeaseDB.owner == owner) | (ChainLeaseDB.locked_until < now),
+        )
+        .update({"owner": owner, "locked_until": locked_until}, synchronize_session=False)
+    )
+    if not renewed:
+        db.add(ChainLeaseDB(name=CHECKPOINT, owner=owner, locked_until=locked_until))
+    try:
+        db.commit()
+    except IntegrityError:  # the row exists and is held by someone else
+        db.rollback()
+        return False
+    return True
+
+
+def _release_lease(owner: str) -> None:
+    with SessionLocal() as db:
+        db.query(ChainLeaseDB).filter(ChainLeaseDB.name == CHECKPOINT, ChainLeaseDB.owner == owner).update(
+            {"locked_until": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+
+
+def batch_trace(db: Session, batch_code: str) -> List[ChainEventDB]:
+    """Indexed on-chain events of a batch, in chain order."""
+    return (
+        db.query(ChainEventDB)
+        .filter(ChainEventDB.batch_code == batch_code)
+        .order_by(ChainEventDB.block_number, ChainEventDB.log_index)
+        .all()
+    )
+
+
+class ChainIndexer:
+    """Background thread scanning contract logs into chain_events."""
+
+    def __init__(self, window_blocks: int, confirmations: int, poll_seconds: float) -> None:
+        self.max_window = window_blocks
+        self.window = window_blocks
+        self.confirmations = confirmations
+        self.poll_seconds = poll_seconds
+        self.owner = uuid.uuid4().hex
+        self.leader = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chain-indexer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        if self.leader:
+            _release_lease(self.owner)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                caught_up = self.step()
+            except Exception as exc:  # pragma: no cover - integration / network errors
+                print("[BC] Chain indexer pass failed:", exc)
+                caught_up = True
+            if caught_up:
+                self._stop.wait(self.poll_seconds)
+
+    def step(self) -> bool:
+        """Scan the next window; returns True once the scan reached the chain head."""
+        start = settings.chain_indexer_start_block
+        with SessionLocal() as db:
+            leader = _acquire_lease(db, self.owner)
+            if leader != self.leader:
+                self.leader = leader
+                print("[BC] Chain indexer " + ("acquired the lease" if leader else "lease held by another process"))
+            if not leader:
+                return True
+            head = head_block()
+            checkpoint = db.get(ChainCheckpointDB, CHECKPOINT)
+            if checkpoint is not None and block_hash(checkpoint.block_number) != checkpoint.block_hash:
+                self._rewind(db, checkpoint)
+                return False
+
+            scanned = checkpoint.block_number if checkpoint is not None else start - 1
+            # The re-scanned tail counts against the window, so halving it shrinks the request;
+            # a reorg deeper than a shrunk tail is still caught by the checkpoint hash check
+            tail = min(self.confirmations, self.window // 2)
+            from_block = max(start, scanned + 1 - tail)
+            to_block = min(head, from_block + self.window - 1)
+            if to_block < from_block:
+                return True
+            try:
+                events = fetch_contract_events(from_block, to_block)
+            except Exception as exc:
+                if self.window > 1 and _range_too_large(exc):
+                    self.window = max(1, self.window // 2)
+                    print(f"[BC] getLogs range too large, indexing {self.window} blocks per window")
+                    return False
+                raise
+
+            db.query(ChainEventDB).filter(ChainEventDB.block_number.between(from_block, to_block)).delete(
+                synchronize_session=False
+            )
+            now = datetime.utcnow()
+            db.add_all(
+                ChainEventDB(
+                    block_number=e["block_number"],
+                    block_hash=e["block_hash"],
+                    tx_hash=e["tx_hash"],
+                    log_index=e["log_index"],
+                    name=e["name"],
+                    batch_code=e["args"].get("batchId"),
+                    args=e["args"],
+                    topics=e["topics"],
+                    data=e["data"],
+                    indexed_at=now,
+                )
+                for e in events
+            )
+            if checkpoint is None:
+                checkpoint = ChainCheckpointDB(name=CHECKPOINT, history=[])
+                db.add(checkpoint)
+            elif to_block > checkpoint.block_number:
+                history = [*checkpoint.history, [checkpoint.block_number, checkpoint.block_hash]]
+                checkpoint.history = history[-settings.chain_indexer_checkpoint_history :]
+            checkpoint.block_number = to_block
+            checkpoint.block_hash = block_hash(to_block)
+            checkpoint.updated_at = now
+            db.commit()
+
+        # Grow back slowly after a provider limit so the window does not oscillate around it
+        self.window = min(self.max_window, self.window + max(1, self.window // 4))
+        if events:
+            print(f"[BC] Indexed {len(events)} contract event(s) in blocks {from_block}-{to_block}")
+        return to_block >= head
+
+    def _rewind(self, db: Session, checkpoint: ChainCheckpointDB) -> None:
+        history = list(checkpoint.history)
+        while history and block_hash(history[-1][0]) != history[-1][1]:
+            history.pop()
+        if not history:
+            # Deeper than every kept checkpoint (see chain_indexer_checkpoint_history)
+            print(f"[BC] Reorg at block {checkpoint.block_number} predates the checkpoint history, re-indexing")
+            db.query(ChainEventDB).delete(synchronize_session=False)
+            db.delete(checkpoint)
+            db.commit()
+            return
+        rewind_to, rewind_hash = history.pop()
+        print(f"[BC] Reorg detected at block {checkpoint.block_number}, re-scanning from {rewind_to + 1}")
+        db.query(ChainEventDB).filter(ChainEventDB.block_number > rewind_to).delete(synchronize_session=False)
+        checkpoint.block_number = rewind_to
+        checkpoint.block_hash = rewind_hash
+        checkpoint.history = history
+        checkpoint.updated_at = datetime.utcnow()
+        db.commit()
+
+
+_indexer: ChainIndexer | None = None
+
+
+def start_chain_indexer() -> None:
+    global _indexer
+    if _indexer is None and settings.chain_indexer_enabled and is_configured():
+        _indexer = ChainIndexer(
+            settings.chain_indexer_window_blocks,
+            settings.chain_indexer_confirmations,
+            settings.chain_indexer_poll_seconds,
+        )
+        _indexer.start()
+
+
+def stop_chain_indexer() -> None:
+    global _indexer
+    if _indexer is not None:
+        _indexer.stop()
+        _indexer = None
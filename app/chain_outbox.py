@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, event, exists
+from sqlalchemy.orm import Session, aliased
+from web3 import Web3
+
+from .blockchain import ChainEvent, is_configured, send_anchor, send_chain_event
+from .chain_anchor import build_merkle_tree, leaf_hash
+from .config import settings
+from .database import SessionLocal, engine
+from .db_models import (
+    ChainAnchorDB,
+    ChainAnchorProofDB,
+    ChainCheckpointDB,
+    ChainEventDB,
+    ChainLeaseDB,
+    ChainOutboxDB,
+    ChainReceiptDB,
+)
+
+
+# Transactional outbox for on-chain events: request handlers add a row in the
+# same DB transaction as the business change and return; background workers
+# send the rows to Polygon, retrying failures with exponential backoff. Events
+# of one batch are sent in order (an event waits while an earlier one of the
+# same batch is pending or in flight). Delivery is at-least-once: an event
+# whose worker dies mid-send is retried after its lease expires.
+# With settings.chain_mode == "anchored" the worker instead claims windows of
+# events and sends one Merkle root per window (see app.chain_anchor).
+
+# (outbox id, contract function name, keyword arguments)
+_Job = Tuple[int, str, Dict[str, Any]]
+
+# Session.info flag: this session enqueued events since its last commit
+_NOTIFY_KEY = "chain_outbox_notify"
+
+
+def ensure_chain_tables() -> None:
+    """Create the chain_* tables if missing (the other tables are managed outside the app)."""
+    for model in (
+        ChainOutboxDB,
+        ChainAnchorDB,
+        ChainAnchorProofDB,
+        ChainReceiptDB,
+        ChainEventDB,
+        ChainCheckpointDB,
+        ChainLeaseDB,
+    ):
+        model.__table__.create(bind=engine, checkfirst=True)
+
+
+def enqueue_chain_event(db: Session, chain_event: ChainEvent) -> ChainOutboxDB:
+    """Add an event to the outbox; it is committed or rolled back with the caller's transaction."""
+    function_name, payload = chain_event
+    now = datetime.utcnow()
+    row = ChainOutboxDB(
+        batch_code=payload["batchId"],
+        function_name=function_name,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(row)
+    # Wake the worker on the next commit of this session (the listener itself stays registered)
+    db.info[_NOTIFY_KEY] = True
+    if not event.contains(db, "after_commit", _after_commit):
+        event.listen(db, "after_commit", _after_commit)
+    return row
+
+
+def _after_commit(session: Session) -> None:
+    if session.info.pop(_NOTIFY_KEY, False):
+        notify_outbox()
+
+
+def _reclaim_expired(db: Session, now: datetime) -> None:
+    # Events whose worker died mid-send become due again
+    db.query(ChainOutboxDB).filter(
+        ChainOutboxDB.status == "sending", ChainOutboxDB.locked_until < now
+    ).update({"status": "pending", "locked_until": None}, synchronize_session=False)
+
+
+def _lease(db: Session, rows: List[ChainOutboxDB], now: datetime) -> List[_Job]:
+    lease = now + timedelta(seconds=settings.chain_outbox_lease_seconds)
+    for row in rows:
+        row.status = "sending"
+        row.locked_until = lease
+        row.updated_at = now
+    jobs = [(row.id, row.function_name, dict(row.payload)) for row in rows]
+    db.commit()
+    return jobs
+
+
+def _claim(limit: int) -> List[_Job]:
+    """Mark up to `limit` due events as in flight and return them."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        _reclaim_expired(db, now)
+        earlier = aliased(ChainOutboxDB)
+        blocked = exists().where(
+            and_(
+                earlier.batch_code == ChainOutboxDB.batch_code,
+                earlier.id < ChainOutboxDB.id,
+                earlier.status.in_(("pending", "sending")),
+            )
+        )
+        rows = (
+            db.query(ChainOutboxDB)
+            .filter(ChainOutboxDB.status == "pending", ChainOutboxDB.next_attempt_at <= now, ~blocked)
+            .order_by(ChainOutboxDB.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        return _lease(db, rows, now)
+
+
+def _claim_window() -> List[_Job]:
+    """Claim a window of due events to anchor, once it is full or its oldest event waited long enough."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        _reclaim_expired(db, now)
+        rows = (
+            db.query(ChainOutboxDB)
+            .filter(ChainOutboxDB.status == "pending", ChainOutboxDB.next_attempt_at <= now)
+            .order_by(ChainOutboxDB.id)
+            .limit(settings.chain_anchor_max_events)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        oldest = min((row.created_at for row in rows), default=now)
+        if not rows or (
+            len(rows) < settings.chain_anchor_max_events
+            and now - oldest < timedelta(seconds=settings.chain_anchor_max_wait_seconds)
+        ):
+            db.commit()
+            return []
+        return _lease(db, rows, now)
+
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = settings.chain_outbox_backoff_seconds * 2 ** (attempts - 1)
+    return min(settings.chain_outbox_max_backoff_seconds, delay) * random.uniform(0.8, 1.2)
+
+
+def _deliver(job: _Job) -> None:
+    outbox_id, function_name, payload = job
+    try:
+        tx_hash = send_chain_event((function_name, payload))
+    except Exception as exc:  # pragma: no cover - integration / network errors
+        _mark_failed(outbox_id, function_name, exc)
+        return
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        db.query(ChainOutboxDB).filter(ChainOutboxDB.id == outbox_id).update(
+            {"status": "sent", "tx_hash": tx_hash, "locked_until": None, "last_error": None, "updated_at": now},
+            synchronize_session=False,
+        )
+        db.commit()
+
+
+def _deliver_anchored(jobs: List[_Job]) -> None:
+    """Send one Merkle root for a window of events and store every event's inclusion proof."""
+    leaves = [leaf_hash(function_name, payload) for _, function_name, payload in jobs]
+    root, proofs = build_merkle_tree(leaves)
+    try:
+        tx_hash = send_anchor(root)
+    except Exception as exc:  # pragma: no cover - integration / network errors
+        for outbox_id, function_name, _ in jobs:
+            _mark_failed(outbox_id, function_name, exc)
+        return
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        anchor = ChainAnchorDB(merkle_root=Web3.to_hex(root), tx_hash=tx_hash, event_count=len(jobs), created_at=now)
+        db.add(anchor)
+        db.flush()
+        for index, ((outbox_id, _, payload), leaf, proof) in enumerate(zip(jobs, leaves, proofs)):
+            db.merge(
+                ChainAnchorProofDB(
+                    outbox_id=outbox_id,
+                    anchor_id=anchor.anchor_id,
+                    batch_code=payload["batchId"],
+                    leaf_index=index,
+                    leaf_hash=Web3.to_hex(leaf),
+                    proof=[list(step) for step in proof],
+                )
+            )
+        db.query(ChainOutboxDB).filter(ChainOutboxDB.id.in_([job[0] for job in jobs])).update(
+            {"status": "sent", "tx_hash": tx_hash, "locked_until": None, "last_error": None, "updated_at": now},
+            synchronize_session=False,
+        )
+        db.commit()
+    print(f"[BC] Anchored {len(jobs)} event(s) under root {Web3.to_hex(root)} in tx {tx_hash}")
+
+
+def _mark_failed(outbox_id: int, function_name: str, exc: Exception) -> None:
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        row = db.get(ChainOutboxDB, outbox_id)
+        if row is None:
+            return
+        row.attempts += 1
+        row.last_error = str(exc)[:2000]
+        row.locked_until = None
+        row.updated_at = now
+        if row.attempts >= settings.chain_outbox_max_attempts:
+            # Kept as "failed" for inspection/replay; later events of the batch are no longer held back
+            row.status = "failed"
+            print(f"[BC] Giving up on outbox event {outbox_id} ({function_name}) after {row.attempts} attempts:", exc)
+        else:
+            row.status = "pending"
+            row.next_attempt_at = now + timedelta(seconds=_backoff_seconds(row.attempts))
+            print(f"[BC] Outbox event {outbox_id} ({function_name}) failed, attempt {row.attempts}:", exc)
+        db.commit()
+
+
+class OutboxWorker:
+    """Poller thread that claims due outbox rows and sends them on a thread pool."""
+
+    def __init__(self, workers: int, poll_seconds: float) -> None:
+        self.poll_seconds = poll_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chain-outbox")
+        self._slots = threading.Semaphore(workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chain-outbox-poller", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=True)  # let in-flight sends record their outcome
+
+    def _release(self, _future: Any) -> None:
+        self._slots.release()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            anchored = settings.chain_mode == "anchored"
+            limit = 1 if anchored else settings.chain_outbox_claim_size  # anchored: one window per slot
+            free = 0
+            while free < limit and self._slots.acquire(blocking=False):
+                free += 1
+            jobs: List[_Job] = []
+            if free:
+                try:
+                    jobs = _claim_window() if anchored else _claim(free)
+                except Exception as exc:  # pragma: no cover - DB unavailable
+                    print("[BC] Could not claim outbox events:", exc)
+            submitted = (1 if jobs else 0) if anchored else len(jobs)
+            for _ in range(free - submitted):
+                self._slots.release()
+            if anchored and jobs:
+                self._pool.submit(_deliver_anchored, jobs).add_done_callback(self._release)
+            elif not anchored:
+                for job in jobs:
+                    self._pool.submit(_deliver, job).add_done_callback(self._release)
+            if not jobs:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+
+_worker: OutboxWorker | None = None
+
+
+def start_outbox_worker() -> None:
+    global _worker
+    if _worker is not None:
+        return
+    if not is_configured():
+        print("[BC] Blockchain not configured, chain events stay queued in the outbox.")
+        return
+    _worker = OutboxWorker(settings.chain_outbox_workers, settings.chain_outbox_poll_seconds)
+    _worker.start()
+
+
+def stop_outbox_worker() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+
+def notify_outbox() -> None:
+    """Wake the worker early (new events were committed)."""
+    if _worker is not None:
+        _worker.notify()
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from .blockchain import fetch_receipt, is_configured, read_anchor
+from .chain_anchor import verify_inclusion
+from .config import settings
+from .database import SessionLocal
+from .db_models import ChainAnchorDB, ChainAnchorProofDB, ChainOutboxDB, ChainReceiptDB
+
+
+# Consumer-facing verification of a batch's on-chain trail. verify_batch()
+# answers from local tables only (outbox, anchor proofs, receipt cache) so a
+# QR scan never waits on an RPC; ReceiptChecker refreshes the receipt cache
+# against the chain in the background.
+
+
+def verify_batch(db: Session, batch_code: str) -> Dict[str, Any]:
+    """Local view of every chain event of a batch: tx hash, block, receipt status and inclusion proof."""
+    events = db.query(ChainOutboxDB).filter(ChainOutboxDB.batch_code == batch_code).order_by(ChainOutboxDB.id).all()
+    proofs = {
+        proof.outbox_id: (proof, anchor)
+        for proof, anchor in db.query(ChainAnchorProofDB, ChainAnchorDB)
+        .join(ChainAnchorDB, ChainAnchorDB.anchor_id == ChainAnchorProofDB.anchor_id)
+        .filter(ChainAnchorProofDB.batch_code == batch_code)
+    }
+    tx_hashes = {e.tx_hash for e in events if e.tx_hash}
+    receipts = {
+        r.tx_hash: r
+        for r in (db.query(ChainReceiptDB).filter(ChainReceiptDB.tx_hash.in_(tx_hashes)).all() if tx_hashes else [])
+    }
+
+    results: List[Dict[str, Any]] = []
+    for event in events:
+        receipt = receipts.get(event.tx_hash) if event.tx_hash else None
+        if event.status in ("pending", "sending"):
+            status = "queued"
+        elif event.status == "failed":
+            status = "failed"
+        elif receipt is None or receipt.status == "pending":
+            status = "submitted"
+        else:
+            status = {"missing": "dropped"}.get(receipt.status, receipt.status)
+
+        entry: Dict[str, Any] = {
+            "event": event.function_name,
+            "payload": event.payload,
+            "status": status,
+            "tx_hash": event.tx_hash,
+            "block_number": receipt.block_number if receipt else None,
+            "checked_at": receipt.checked_at if receipt else None,
+            "anchored": event.id in proofs,
+        }
+        if event.id in proofs:
+            proof, anchor = proofs[event.id]
+            proof_valid = verify_inclusion(event.function_name, event.payload, proof.proof, anchor.merkle_root)
+            entry.update(merkle_root=anchor.merkle_root, proof=proof.proof, proof_valid=proof_valid)
+            anchor_ok = receipt is not None and receipt.anchor_verified is not False
+            if status == "confirmed" and not (proof_valid and anchor_ok):
+                entry["status"] = "mismatch"
+        results.append(entry)
+
+    return {
+        "batch_id": batch_code,
+        "verified": bool(results) and all(e["status"] == "confirmed" for e in results),
+        "events": results,
+    }
+
+
+def _due_tx_hashes(db: Session, now: datetime, limit: int) -> List[str]:
+    pending_before = now - timedelta(seconds=settings.chain_receipt_recheck_pending_seconds)
+    confirmed_before = now - timedelta(seconds=settings.chain_receipt_recheck_confirmed_seconds)
+    rows = (
+        db.query(ChainOutboxDB.tx_hash)
+        .outerjoin(ChainReceiptDB, ChainReceiptDB.tx_hash == ChainOutboxDB.tx_hash)
+        .filter(ChainOutboxDB.status == "sent", ChainOutboxDB.tx_hash.isnot(None))
+        .filter(
+            or_(
+                ChainReceiptDB.tx_hash.is_(None),
+                and_(ChainReceiptDB.status.in_(("pending", "missing")), ChainReceiptDB.checked_at < pending_before),
+                ChainReceiptDB.checked_at < confirmed_before,
+            )
+        )
+        .distinct()
+        .limit(limit)
+        .all()
+    )
+    return [r[0] for r in rows]
+
+
+def refresh_receipt(db: Session, tx_hash: str) -> ChainReceiptDB:
+    """Re-read one transaction from the chain into the receipt cache."""
+    now = datetime.utcnow()
+    status, block_number = fetch_receipt(tx_hash)
+    receipt = db.get(ChainReceiptDB, tx_hash)
+    if receipt is None:
+        receipt = ChainReceiptDB(tx_hash=tx_hash, status=status, first_checked_at=now, checked_at=now)
+        db.add(receipt)
+    receipt.status = status
+    receipt.block_number = block_number
+    receipt.checked_at = now
+
+    anchor = db.query(ChainAnchorDB).filter(ChainAnchorDB.tx_hash == tx_hash).first()
+    if anchor is not None and status == "confirmed" and receipt.anchor_verified is None:
+        receipt.anchor_verified = read_anchor(tx_hash) == anchor.merkle_root
+
+    if status == "missing" and now - receipt.first_checked_at > timedelta(seconds=settings.chain_receipt_drop_seconds):
+        # The node dropped the transaction: queue its events again
+        count = (
+            db.query(ChainOutboxDB)
+            .filter(ChainOutboxDB.tx_hash == tx_hash, ChainOutboxDB.status == "sent")
+            .update({"status": "pending", "next_attempt_at": now, "updated_at": now}, synchronize_session=False)
+        )
+        db.delete(receipt)
+        print(f"[BC] Transaction {tx_hash} was dropped, re-queued {count} event(s)")
+    db.commit()
+    return receipt
+
+
+class ReceiptChecker:
+    """Background thread keeping chain_receipts in sync with the chain."""
+
+    def __init__(self, poll_seconds: float) -> None:
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chain-receipts", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                with SessionLocal() as db:
+                    due = _due_tx_hashes(db, datetime.utcnow(), settings.chain_receipt_check_size)
+                    for tx_hash in due:
+                        if self._stop.is_set():
+                            break
+                        try:
+                            refresh_receipt(db, tx_hash)
+                        except Exception as exc:  # pragma: no cover - integration / network errors
+                            db.rollback()
+                            print("[BC] Could not refresh receipt", tx_hash, exc)
+            except Exception as exc:  # pragma: no cover - DB unavailable
+                print("[BC] Receipt check failed:", exc)
+
+
+_checker: ReceiptChecker | None = None
+
+
+def start_receipt_checker() -> None:
+    global _checker
+    if _checker is None and is_configured():
+        _checker = ReceiptChecker(settings.chain_receipt_poll_seconds)
+        _checker.start()
+
+
+def stop_receipt_checker() -> None:
+    global _checker
+    if _checker is not None:
+        _checker.stop()
+        _checker = None
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -26,6 +28,40 @@ class Settings(BaseSettings):
     polygon_private_key: str | None = None
     agrichain_contract_address: str | None = None
 
+    chain_nonce_resync_seconds: float = 60.0  # idle time after which the local nonce is re-read
+
+    # "per_event": one contract call per event. "anchored": outbox events are collected for up to
+    # chain_anchor_max_wait_seconds / chain_anchor_max_events and only their Merkle root is sent.
+    chain_mode: Literal["per_event", "anchored"] = "per_event"
+    chain_anchor_max_events: int = 256
+    chain_anchor_max_wait_seconds: float = 60.0
+    chain_anchor_gas: int = 30_000
+
+    # Chain outbox: events are sent by background workers, retried with exponential backoff
+    chain_outbox_workers: int = 4
+    chain_outbox_poll_seconds: float = 1.0
+    chain_outbox_claim_size: int = 16
+    chain_outbox_max_attempts: int = 12
+    chain_outbox_backoff_seconds: float = 2.0
+    chain_outbox_max_backoff_seconds: float = 600.0
+    chain_outbox_lease_seconds: float = 120.0  # a claimed event is retried if not finished by then
+
+    # Receipt cache behind /consumer/products/{id}/verify, refreshed by a background checker
+    chain_receipt_poll_seconds: float = 5.0
+    chain_receipt_check_size: int = 50
+    chain_receipt_recheck_pending_seconds: float = 15.0
+    chain_receipt_recheck_confirmed_seconds: float = 3600.0
+    chain_receipt_drop_seconds: float = 600.0  # a tx unknown to the node this long is re-sent
+
+    # Contract log indexer (eth_getLogs in block windows, checkpointed in chain_checkpoints)
+    chain_indexer_enabled: bool = True
+    chain_indexer_start_block: int = 0  # contract deployment block
+    chain_indexer_window_blocks: int = 2000
+    chain_indexer_confirmations: int = 64  # tail re-scanned every pass so reorgs are picked up
+    chain_indexer_poll_seconds: float = 10.0
+    chain_indexer_checkpoint_history: int = 128  # past checkpoints kept to find the reorg point
+    chain_indexer_lease_seconds: float = 60.0  # another worker process takes over if not renewed by then
+
     class Config:
         env_file = ".env"
 
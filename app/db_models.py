@@ -4,6 +4,7 @@ from datetime import datetime
 
 from sqlalchemy import (
     JSON,
+    Boolean,
     Column,
     DateTime,
     Enum,
@@ -11,6 +12,7 @@ from sqlalchemy import (
     Integer,
     String,
     Text,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -79,3 +81,102 @@ class BatchDB(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     farmer = relationship("UserDB")
+
+
+class ChainOutboxDB(Base):
+    """On-chain events waiting to be sent, written in the same transaction as the business change."""
+
+    __tablename__ = "chain_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_code = Column(String(50), nullable=False, index=True)
+    function_name = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/sending/sent/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime)
+    tx_hash = Column(String(80))
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChainAnchorDB(Base):
+    """One on-chain transaction carrying the Merkle root of a window of outbox events."""
+
+    __tablename__ = "chain_anchors"
+
+    anchor_id = Column(Integer, primary_key=True, autoincrement=True)
+    merkle_root = Column(String(66), nullable=False, index=True)
+    tx_hash = Column(String(80), nullable=False)
+    event_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChainAnchorProofDB(Base):
+    """Inclusion proof of one outbox event in an anchored Merkle tree."""
+
+    __tablename__ = "chain_anchor_proofs"
+
+    outbox_id = Column(Integer, ForeignKey("chain_outbox.id", ondelete="CASCADE"), primary_key=True)
+    anchor_id = Column(Integer, ForeignKey("chain_anchors.anchor_id", ondelete="CASCADE"), nullable=False, index=True)
+    batch_code = Column(String(50), nullable=False, index=True)
+    leaf_index = Column(Integer, nullable=False)
+    leaf_hash = Column(String(66), nullable=False)
+    proof = Column(JSON, nullable=False)  # [[sibling hash, "L" | "R"], ...] from leaf to root
+
+
+class ChainReceiptDB(Base):
+    """Last known on-chain state of a sent transaction, refreshed in the background."""
+
+    __tablename__ = "chain_receipts"
+
+    tx_hash = Column(String(80), primary_key=True)
+    status = Column(String(20), nullable=False)  # pending/confirmed/reverted/missing
+    block_number = Column(Integer)
+    anchor_verified = Column(Boolean)  # anchor txs: the calldata carries the stored Merkle root
+    first_checked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    checked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChainEventDB(Base):
+    """A contract log read back from the chain by the indexer."""
+
+    __tablename__ = "chain_events"
+    __table_args__ = (UniqueConstraint("tx_hash", "log_index", name="uq_chain_events_log"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    block_number = Column(Integer, nullable=False, index=True)
+    block_hash = Column(String(66), nullable=False)
+    tx_hash = Column(String(80), nullable=False, index=True)
+    log_index = Column(Integer, nullable=False)
+    name = Column(String(64), nullable=False)  # ABI event, or the contract function that emitted the log
+    batch_code = Column(String(50), index=True)
+    args = Column(JSON, nullable=False)
+    topics = Column(JSON, nullable=False)
+    data = Column(Text)
+    indexed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChainCheckpointDB(Base):
+    """Last block an indexer has fully scanned (and its hash, to detect reorgs)."""
+
+    __tablename__ = "chain_checkpoints"
+
+    name = Column(String(50), primary_key=True)
+    block_number = Column(Integer, nullable=False)
+    block_hash = Column(String(66), nullable=False)
+    # Earlier checkpoints as [block_number, block_hash], oldest first: where to rewind to after a reorg
+    history = Column(JSON, nullable=False, default=list)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChainLeaseDB(Base):
+    """Which process runs a singleton chain worker (e.g. the log indexer) until the lease expires."""
+
+    __tablename__ = "chain_leases"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(64), nullable=False)
+    locked_until = Column(DateTime, nullable=False)
@@ -2,6 +2,9 @@ from fastapi import FastAPI
 
 from .routers import auth, farmer, distributor, retailer, consumer, alerts, chat, ai_assistant
 from .database import test_connection
+from .chain_outbox import ensure_chain_tables, start_outbox_worker, stop_outbox_worker
+from .chain_verify import start_receipt_checker, stop_receipt_checker
+from .chain_indexer import start_chain_indexer, stop_chain_indexer
 
 app = FastAPI(
     title="AgriChain – Supply Chain Transparency Backend",
@@ -13,6 +16,17 @@ app = FastAPI(
 def on_startup() -> None:
     # This will print a message in the console about MySQL connection status
     test_connection()
+    ensure_chain_tables()
+    start_outbox_worker()
+    start_receipt_checker()
+    start_chain_indexer()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    stop_outbox_worker()
+    stop_receipt_checker()
+    stop_chain_indexer()
 
 app.include_router(auth.router)
 app.include_router(farmer.router)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import rag_config
+
+
+AnswerKey = Tuple[str, str, str]
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop surrounding punctuation."""
+    text = re.sub(r"\s+", " ", question.lower()).strip()
+    return text.strip(" ?!.,;:")
+
+
+@dataclass
+class _Entry:
+    answer: str
+    embedding: Optional[np.ndarray]  # unit-normalized question embedding
+    created_at: float
+
+
+class AnswerCache:
+    """TTL + LRU cache of generated answers keyed by (role, use_case, question).
+
+    Lookups first try the exact normalized question. On a miss, the question
+    embedding is compared (cosine similarity) against cached questions with the
+    same role and use_case and the closest one is reused if it clears the
+    similarity threshold.
+
+    The cache is dropped whenever the corpus version stamp written by
+    `mark_corpus_updated` changes, so re-ingesting papers in another process
+    invalidates answers held by running servers.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[AnswerKey, _Entry]" = OrderedDict()
+        self._corpus_version = corpus_version()
+        self._stats: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(role: str, use_case: Optional[str], question: str) -> AnswerKey:
+        return (role, use_case or "", normalize_question(question))
+
+    def _check_corpus_version(self) -> None:
+        version = corpus_version()
+        if version != self._corpus_version:
+            self._entries.clear()
+            self._corpus_version = version
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def get_exact(self, role: str, use_case: Optional[str], question: str) -> Optional[str]:
+        key = self._key(role, use_case, question)
+        with self._lock:
+            self._check_corpus_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry.answer
+
+    def has_candidates(self, role: str, use_case: Optional[str]) -> bool:
+        """Whether a similarity lookup could possibly hit (saves an embedding call)."""
+        with self._lock:
+            return any(k[:2] == (role, use_case or "") for k in self._entries)
+
+    def get_similar(
+        self,
+        role: str,
+        use_case: Optional[str],
+        embedding: Optional[List[float]],
+        threshold: Optional[float] = None,
+    ) -> Optional[str]:
+        """Closest cached answer for the role/use_case if it clears `threshold` (default: the cache's)."""
+        query = _unit(embedding)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (k, e)
+                for k, e in self._entries.items()
+                if k[:2] == (role, use_case or "") and e.embedding is not None and not self._expired(e, now)
+            ]
+            if not candidates:
+                return None
+            matrix = np.stack([e.embedding for _, e in candidates])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < (self.similarity_threshold if threshold is None else threshold):
+                return None
+            best_key, best_entry = candidates[best]
+            self._entries.move_to_end(best_key)
+            self._stats["semantic_hits"] += 1
+            return best_entry.answer
+
+    def get(
+        self,
+        role: str,
+        use_case: Optional[str],
+        question: str,
+        embed: Callable[[str], Optional[List[float]]],
+    ) -> Optional[str]:
+        """Exact lookup, then similarity lookup using `embed(question)`."""
+        answer = self.get_exact(role, use_case, question)
+        if answer is None and self.has_candidates(role, use_case):
+            answer = self.get_similar(role, use_case, embed(question))
+        if answer is None:
+            self.record_miss()
+        return answer
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def put(
+        self,
+        role: str,
+        use_case: Optional[str],
+        question: str,
+        answer: str,
+        embedding: Optional[List[float]],
+    ) -> None:
+        key = self._key(role, use_case, question)
+        entry = _Entry(answer=answer, embedding=_unit(embedding), created_at=time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Exact/semantic hit and miss counters since process start plus the current size."""
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "lookups": hits + self._stats["misses"],
+                "entries": len(self._entries),
+            }
+
+
+def _unit(vec: Optional[List[float]]) -> Optional[np.ndarray]:
+    if not vec:
+        return None
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else None
+
+
+def corpus_version() -> float:
+    """Current corpus version stamp (0.0 if the corpus was never ingested)."""
+    try:
+        return os.stat(rag_config.corpus_version_path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def mark_corpus_updated() -> None:
+    """Bump the corpus version stamp; every AnswerCache drops its entries on next use."""
+    path = Path(rag_config.corpus_version_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(str(time.time()))
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache, or None when disabled in RagConfig."""
+    if not rag_config.answer_cache_enabled:
+        return None
+    return AnswerCache(
+        max_entries=rag_config.answer_cache_max_entries,
+        ttl_seconds=rag_config.answer_cache_ttl_seconds,
+        similarity_threshold=rag_config.answer_cache_similarity_threshold,
+    )
+
+
+def answer_cache_stats() -> Dict[str, int]:
+    cache = get_answer_cache()
+    return cache.stats() if cache is not None else {}
+
+
+def invalidate_answer_cache() -> None:
+    """Admin hook: drop cached answers here and in every other running process."""
+    mark_corpus_updated()
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.clear()
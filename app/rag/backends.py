@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import time
+from typing import AsyncIterator, List
+
+from .lexical import tokenize
+
+
+def hashing_embed(texts: List[str], dim: int) -> List[List[float]]:
+    """Deterministic local embeddings via signed feature hashing of unigrams and bigrams.
+
+    Texts that share words get similar vectors, which is enough to exercise
+    retrieval offline (benchmarks, development without a GEMINI_API_KEY).
+    """
+    vectors: List[List[float]] = []
+    for text in texts:
+        vec = [0.0] * dim
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec))
+        vectors.append([v / norm for v in vec] if norm else vec)
+    return vectors
+
+
+class FakeGenerator:
+    """Stand-in for Gemini generation: a fixed-shape answer after a configurable delay."""
+
+    def __init__(self, delay: float, stream_parts: int = 8) -> None:
+        self.delay = delay
+        self.stream_parts = stream_parts
+
+    @staticmethod
+    def _answer(parts: List[str]) -> str:
+        question = str(parts[-1]) if parts else ""
+        n_chunks = sum(1 for p in parts if str(p).startswith("[Chunk "))
+        return (
+            "**Answer**\n"
+            f"- Based on {n_chunks} context chunk(s).\n"
+            f"- Question length: {len(question)} characters.\n"
+            "Would you like more suggestions?"
+        )
+
+    def generate(self, parts: List[str]) -> str:
+        time.sleep(self.delay)
+        return self._answer(parts)
+
+    async def generate_async(self, parts: List[str]) -> str:
+        await asyncio.sleep(self.delay)
+        return self._answer(parts)
+
+    async def stream(self, parts: List[str]) -> AsyncIterator[str]:
+        answer = self._answer(parts)
+        step = max(1, len(answer) // self.stream_parts)
+        for start in range(0, len(answer), step):
+            await asyncio.sleep(self.delay / self.stream_parts)
+            yield answer[start : start + step]
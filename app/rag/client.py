@@ -1,13 +1,34 @@
 from __future__ import annotations
 
-from functools import lru_cache
-from typing import Any, Dict, List
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import aclosing
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple, TypeVar
 
 import chromadb
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 from app.config import settings
+from .backends import FakeGenerator, hashing_embed
 from .config import rag_config
+from .embedding_cache import cache_key, get_embedding_cache
+from .metrics import increment, timed
+from .resilience import (
+    call_with_resilience,
+    call_with_resilience_async,
+    stream_with_resilience_async,
+)
+
+
+T = TypeVar("T")
+
+FALLBACK_ANSWER = "I am unable to generate an answer right now. Please try again later."
 
 
 @lru_cache(maxsize=1)
@@ -30,70 +51,417 @@ def _configure_gemini() -> None:
     genai.configure(api_key=settings.gemini_api_key)
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Embed a list of texts using Gemini embeddings.
+# Errors worth retrying with backoff: rate limiting and transient server-side failures.
+_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+# Quota errors are retried with backoff and do not count against the circuit breaker
+_QUOTA_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+
+def _extract_vectors(result: Any, expected: int) -> List[List[float]]:
+    """Normalize a (batch) embed_content response into a list of vectors.
 
-    We call the embedding API once per text to avoid shape/compat issues and
-    always return List[List[float]] suitable for Chroma.
+    google-generativeai returns {"embedding": [[...], ...]} for a batch, and either
+    [...] or {"values": [...]} per item depending on the library version.
     """
+    if not (isinstance(result, dict) and "embedding" in result):
+        raise RuntimeError("Unexpected embedding response from Gemini: missing 'embedding' key")
+
+    vectors: List[List[float]] = []
+    for emb in result["embedding"]:
+        vec = emb["values"] if isinstance(emb, dict) and "values" in emb else emb
+        if not isinstance(vec, list):
+            raise RuntimeError("Gemini embedding is not a list of floats")
+        vectors.append(vec)
+
+    if len(vectors) != expected:
+        raise RuntimeError(f"Gemini returned {len(vectors)} embeddings for {expected} texts")
+    return vectors
+
+
+def _make_batches(indices: List[int], texts: List[str]) -> List[List[int]]:
+    """Group text indices into batches bounded by count and total characters."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for idx in indices:
+        size = len(texts[idx])
+        if current and (
+            len(current) >= rag_config.embed_batch_size
+            or current_chars + size > rag_config.embed_batch_max_chars
+        ):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(idx)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embedding_model_id() -> str:
+    """Identity of the active embedding backend, part of every embedding cache key."""
+    if rag_config.embedding_backend == "hashing":
+        return f"local-hashing-{rag_config.hashing_embedding_dim}"
+    return rag_config.embedding_model
+
+
+@lru_cache(maxsize=1)
+def _fake_generator() -> FakeGenerator:
+    return FakeGenerator(delay=rag_config.fake_generation_delay)
+
+
+def _embed_batch(batch: List[str], task_type: str) -> List[List[float]]:
+    """Embed one batch with a single API call, retrying with exponential backoff."""
+    if rag_config.embedding_backend == "hashing":
+        return hashing_embed(batch, rag_config.hashing_embedding_dim)
+    _configure_gemini()
+    delay = rag_config.embed_retry_base_delay
+    for attempt in range(rag_config.embed_max_retries + 1):
+        try:
+            result = call_with_resilience(
+                "embed",
+                partial(
+                    genai.embed_content,
+                    model=rag_config.embedding_model,
+                    content=batch,
+                    task_type=task_type,
+                    request_options={"timeout": rag_config.embed_timeout_seconds},
+                ),
+                timeout=rag_config.embed_timeout_seconds,
+                ignore=_QUOTA_ERRORS,
+            )
+            return _extract_vectors(result, len(batch))
+        except _RETRYABLE_ERRORS as exc:
+            if attempt == rag_config.embed_max_retries:
+                raise
+            wait = delay * (1 + random.random())
+            print(f"[RAG] Embedding batch rate-limited ({exc.__class__.__name__}), retrying in {wait:.1f}s")
+            time.sleep(wait)
+            delay *= 2
+    return []  # unreachable, keeps type checkers happy
+
+
+async def _embed_batch_async(batch: List[str], task_type: str) -> List[List[float]]:
+    """Async twin of _embed_batch, bounded by the embedding stage semaphore."""
+    if rag_config.embedding_backend == "hashing":
+        return hashing_embed(batch, rag_config.hashing_embedding_dim)
     _configure_gemini()
+    delay = rag_config.embed_retry_base_delay
+    for attempt in range(rag_config.embed_max_retries + 1):
+        try:
+            async with _stage_semaphore("embed"):
+                result = await call_with_resilience_async(
+                    "embed",
+                    partial(
+                        genai.embed_content_async,
+                        model=rag_config.embedding_model,
+                        content=batch,
+                        task_type=task_type,
+                        request_options={"timeout": rag_config.embed_timeout_seconds},
+                    ),
+                    timeout=rag_config.embed_timeout_seconds,
+                    ignore=_QUOTA_ERRORS,
+                )
+            return _extract_vectors(result, len(batch))
+        except _RETRYABLE_ERRORS as exc:
+            if attempt == rag_config.embed_max_retries:
+                raise
+            wait = delay * (1 + random.random())
+            print(f"[RAG] Embedding batch rate-limited ({exc.__class__.__name__}), retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay *= 2
+    return []  # unreachable, keeps type checkers happy
+
+
+def _prepare_embeddings(
+    texts: List[str], task_type: str
+) -> Tuple[List[List[float]], List[int], Dict[int, str]]:
+    """Fill cached vectors; return (embeddings, indices still to embed, cache keys)."""
+    # Keep alignment: empty texts get an empty vector placeholder
+    embeddings: List[List[float]] = [[] for _ in texts]
+    indices = [i for i, text in enumerate(texts) if text]
+
+    cache = get_embedding_cache()
+    keys: Dict[int, str] = {}
+    if cache is not None and indices:
+        keys = {i: cache_key(_embedding_model_id(), task_type, texts[i]) for i in indices}
+        cached = cache.get_many(list(set(keys.values())))
+        for i in indices:
+            vec = cached.get(keys[i])
+            if vec is not None:
+                embeddings[i] = vec
+        indices = [i for i in indices if not embeddings[i]]
+    return embeddings, indices, keys
+
+
+def _store_embeddings(
+    batch: List[int], vectors: List[List[float]], embeddings: List[List[float]], keys: Dict[int, str]
+) -> None:
+    for i, vec in zip(batch, vectors):
+        embeddings[i] = vec
+    cache = get_embedding_cache()
+    if cache is not None:
+        cache.put_many({keys[i]: embeddings[i] for i in batch})
+
+
+@timed("embed")
+def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+    """Embed a list of texts using Gemini embeddings.
+
+    Texts already present in the embedding cache are served from it. The rest
+    are sent in size-bounded batches, with up to rag_config.embed_max_concurrency
+    batches in flight at once, and written back to the cache. The result is
+    aligned with the input and always List[List[float]] suitable for Chroma;
+    empty texts get an empty vector placeholder.
+    """
     if not texts:
         return []
 
-    embeddings: List[List[float]] = []
-    for text in texts:
-        if not text:
-            # Keep alignment: append an empty vector placeholder
-            embeddings.append([])
-            continue
-
-        result = genai.embed_content(
-            model=rag_config.embedding_model,
-            content=text,
-            task_type="retrieval_document",
-        )
+    embeddings, indices, keys = _prepare_embeddings(texts, task_type)
+    batches = _make_batches(indices, texts)
+    if not batches:
+        return embeddings
+
+    def run(batch: List[int]) -> None:
+        vectors = _embed_batch([texts[i] for i in batch], task_type)
+        _store_embeddings(batch, vectors, embeddings, keys)
+
+    if len(batches) == 1:
+        run(batches[0])
+        return embeddings
+
+    workers = min(rag_config.embed_max_concurrency, len(batches))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-embed") as pool:
+        # list() surfaces the first exception raised by any batch
+        list(pool.map(run, batches))
+    return embeddings
+
+
+async def embed_texts_async(texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+    """Non-blocking variant of embed_texts for use inside request handlers.
+
+    Uses the async Gemini client; concurrency across all callers is bounded by
+    rag_config.async_embed_concurrency.
+    """
+    if not texts:
+        return []
+
+    # The embedding cache is SQLite: keep its reads and writes off the event loop
+    embeddings, indices, keys = await run_in_chroma_executor(_prepare_embeddings, texts, task_type)
+
+    async def run(batch: List[int]) -> None:
+        vectors = await _embed_batch_async([texts[i] for i in batch], task_type)
+        await run_in_chroma_executor(_store_embeddings, batch, vectors, embeddings, keys)
+
+    with timed("embed"):
+        await asyncio.gather(*(run(batch) for batch in _make_batches(indices, texts)))
+    return embeddings
+
+
+class _QueryBatcher:
+    """Coalesces concurrent single-query embedding calls from threads into one embed_texts call.
 
-        # google-generativeai returns either {"embedding": [...]} or
-        # {"embedding": {"values": [...]}} for text-embedding-004.
-        if isinstance(result, dict) and "embedding" in result:
-            emb = result["embedding"]
-            if isinstance(emb, dict) and "values" in emb:
-                vec = emb["values"]
+    The first caller in a window becomes the leader: it waits up to
+    rag_config.query_batch_window_ms (or until rag_config.query_batch_max_size
+    callers have joined), embeds everything collected so far in one call and
+    hands each waiting caller its vector.
+    """
+
+    def __init__(self, task_type: str) -> None:
+        self.task_type = task_type
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+        self._pending: List[Tuple[str, Future]] = []
+
+    def embed(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((text, future))
+            leader = len(self._pending) == 1
+            if len(self._pending) >= rag_config.query_batch_max_size:
+                self._full.set()
+        if leader:
+            self._full.wait(rag_config.query_batch_window_ms / 1000.0)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._full.clear()
+            _record_query_batch(len(batch))
+            try:
+                vectors = embed_texts([t for t, _ in batch], self.task_type)
+            except Exception as exc:
+                for _, waiter in batch:
+                    waiter.set_exception(exc)
             else:
-                vec = emb
+                for (_, waiter), vector in zip(batch, vectors):
+                    waiter.set_result(vector)
+        return future.result()
+
+
+class _AsyncQueryBatcher:
+    """Event-loop twin of _QueryBatcher built on embed_texts_async."""
+
+    def __init__(self, task_type: str) -> None:
+        self.task_type = task_type
+        self._full = asyncio.Event()
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) == 1:
+            task = loop.create_task(self._flush_after_window())
+            self._flushes.add(task)  # keep a reference until it finishes
+            task.add_done_callback(self._flushes.discard)
+        if len(self._pending) >= rag_config.query_batch_max_size:
+            self._full.set()
+        return await future
+
+    async def _flush_after_window(self) -> None:
+        try:
+            await asyncio.wait_for(self._full.wait(), rag_config.query_batch_window_ms / 1000.0)
+        except asyncio.TimeoutError:
+            pass
+        batch, self._pending = self._pending, []
+        self._full.clear()
+        _record_query_batch(len(batch))
+        try:
+            vectors = await embed_texts_async([t for t, _ in batch], self.task_type)
+        except Exception as exc:
+            for _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_exception(exc)
         else:
-            raise RuntimeError("Unexpected embedding response from Gemini: missing 'embedding' key")
+            for (_, waiter), vector in zip(batch, vectors):
+                if not waiter.done():  # the caller may have been cancelled meanwhile
+                    waiter.set_result(vector)
 
-        if not isinstance(vec, list):
-            raise RuntimeError("Gemini embedding is not a list of floats")
-        embeddings.append(vec)
 
-    return embeddings
+def _record_query_batch(size: int) -> None:
+    increment("query_embed_batches")
+    increment("query_embed_requests", size)
+
+
+def _query_batching_enabled() -> bool:
+    return rag_config.query_batch_window_ms > 0 and rag_config.query_batch_max_size > 1
+
+
+_QUERY_BATCHERS: Dict[str, _QueryBatcher] = {}
+_QUERY_BATCHERS_LOCK = threading.Lock()
+_ASYNC_QUERY_BATCHERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _AsyncQueryBatcher]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def embed_query(text: str, task_type: str = "retrieval_document") -> List[float]:
+    """Embed one query, coalesced with concurrent callers into a single batched call."""
+    if not _query_batching_enabled():
+        return embed_texts([text], task_type)[0]
+    with _QUERY_BATCHERS_LOCK:
+        batcher = _QUERY_BATCHERS.setdefault(task_type, _QueryBatcher(task_type))
+    return batcher.embed(text)
+
+
+async def embed_query_async(text: str, task_type: str = "retrieval_document") -> List[float]:
+    """Async embed_query: queries arriving within the batching window share one embedding call."""
+    if not _query_batching_enabled():
+        return (await embed_texts_async([text], task_type))[0]
+    batchers = _ASYNC_QUERY_BATCHERS.setdefault(asyncio.get_running_loop(), {})
+    batcher = batchers.get(task_type)
+    if batcher is None:
+        batcher = batchers[task_type] = _AsyncQueryBatcher(task_type)
+    return await batcher.embed(text)
+
+
+@lru_cache(maxsize=1)
+def _chroma_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=rag_config.chroma_executor_workers, thread_name_prefix="rag-chroma")
+
+
+async def run_in_chroma_executor(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking Chroma call on the dedicated Chroma thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_chroma_executor(), partial(fn, *args, **kwargs))
 
-def generate_answer(prompt: str, context_chunks: List[str]) -> str:
-    """Call Gemini 2.0 Flash to generate an answer.
 
-    The prompt must tell the model to base its answer primarily on the given context.
+# Keyed by event loop like the query batchers: an asyncio.Semaphore is bound to the loop that first waits on it
+_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _stage_semaphore(stage: str) -> asyncio.Semaphore:
+    """Per-stage concurrency limit shared by all requests on the running event loop."""
+    semaphores = _SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    sem = semaphores.get(stage)
+    if sem is None:
+        limits = {
+            "embed": rag_config.async_embed_concurrency,
+            "generate": rag_config.async_generate_concurrency,
+        }
+        sem = semaphores[stage] = asyncio.Semaphore(limits[stage])
+    return sem
+
+
+SYSTEM_INSTRUCTIONS = (
+    "You are an agricultural expert assistant for Indian smallholder farmers. "
+    "Always give practical, step-by-step guidance in a warm, friendly tone. "
+    "Present every answer in a clearly structured way using short headings and bullet "
+    "points instead of long paragraphs. When context from research papers is provided, "
+    "base your core factual statements primarily on that context, but you may also add "
+    "extra practical tips and general agronomy knowledge if it will help the farmer. "
+    "Do not mention research papers, retrieval, or any internal systems. At the end of "
+    "your answer, add one short, friendly follow-up question asking if they would like "
+    "more suggestions or recommendations."
+)
+
+ROLE_NOTES: Dict[str, str] = {
+    "farmer": (
+        "You are answering a question from a FARMER. Focus on very practical field-level "
+        "advice: clear symptoms, step-by-step controls, safe waiting periods, and cost-effective options."
+    ),
+    "distributor": (
+        "You are answering a question from a DISTRIBUTOR. Focus only on transport, storage, "
+        "spoilage reduction, temperature/moisture control, and packaging. Do not give farm-level crop advice."
+    ),
+}
+
+LANGUAGE_NOTE = (
+    "Answer in simple language that a non-technical farmer could understand. "
+    "Do not mention research papers, RAG, retrieval, or any internal systems."
+)
+
+
+@lru_cache(maxsize=None)
+def system_instruction(role: Optional[str]) -> str:
+    """Static instruction block for a role, built once and sent as the model's system instruction."""
+    notes = [SYSTEM_INSTRUCTIONS, ROLE_NOTES.get(role or "", ""), LANGUAGE_NOTE]
+    return "\n\n".join(n for n in notes if n)
+
+
+@lru_cache(maxsize=None)
+def _generative_model(model_name: str, role: Optional[str]) -> genai.GenerativeModel:
+    """Long-lived model per (model, role).
+
+    The model object keeps its sync/async API clients (and their connections)
+    after the first call, and carries the static instructions as its
+    system_instruction so requests only send the per-question parts.
     """
     _configure_gemini()
-    model = genai.GenerativeModel(rag_config.generation_model)
-
-    system_instructions = (
-        "You are an agricultural expert assistant for Indian smallholder farmers. "
-        "Always give practical, step-by-step guidance in a warm, friendly tone. "
-        "Present every answer in a clearly structured way using short headings and bullet "
-        "points instead of long paragraphs. When context from research papers is provided, "
-        "base your core factual statements primarily on that context, but you may also add "
-        "extra practical tips and general agronomy knowledge if it will help the farmer. "
-        "Do not mention research papers, retrieval, or any internal systems. At the end of "
-        "your answer, add one short, friendly follow-up question asking if they would like "
-        "more suggestions or recommendations."
-    )
-
-    parts: List[Any] = [
-        system_instructions,
-        "\n\nCONTEXT FROM RESEARCH PAPERS:\n",
-    ]
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction(role))
+
+
+def _build_parts(prompt: str, context_chunks: List[str]) -> List[Any]:
+    """Variable part of the request: retrieved context and the question."""
+    parts: List[Any] = ["CONTEXT FROM RESEARCH PAPERS:\n"]
     if context_chunks:
         for i, chunk in enumerate(context_chunks, start=1):
             parts.append(f"[Chunk {i}] {chunk}\n")
@@ -102,6 +470,76 @@ def generate_answer(prompt: str, context_chunks: List[str]) -> str:
 
     parts.append("\nUSER QUESTION:\n")
     parts.append(prompt)
+    return parts
 
-    response = model.generate_content(parts)
-    return response.text or "I am unable to generate an answer right now. Please try again later."
+
+def generate_answer(prompt: str, context_chunks: List[str], role: Optional[str] = None) -> str:
+    """Call Gemini 2.0 Flash to generate an answer.
+
+    The system instruction (see system_instruction) tells the model to base its
+    answer primarily on the given context.
+    """
+    parts = _build_parts(prompt, context_chunks)
+    with timed("generate"):
+        if rag_config.generation_backend == "fake":
+            return _fake_generator().generate(parts)
+        model = _generative_model(rag_config.generation_model, role)
+        timeout = rag_config.generate_timeout_seconds
+        response = call_with_resilience(
+            "generate",
+            partial(model.generate_content, parts, request_options={"timeout": timeout}),
+            timeout=timeout,
+        )
+    return response.text or FALLBACK_ANSWER
+
+
+async def generate_answer_async(prompt: str, context_chunks: List[str], role: Optional[str] = None) -> str:
+    """Non-blocking variant of generate_answer, bounded by rag_config.async_generate_concurrency."""
+    parts = _build_parts(prompt, context_chunks)
+    async with _stage_semaphore("generate"):
+        with timed("generate"):
+            if rag_config.generation_backend == "fake":
+                return await _fake_generator().generate_async(parts)
+            model = _generative_model(rag_config.generation_model, role)
+            timeout = rag_config.generate_timeout_seconds
+            response = await call_with_resilience_async(
+                "generate",
+                partial(model.generate_content_async, parts, request_options={"timeout": timeout}),
+                timeout=timeout,
+            )
+    return response.text or FALLBACK_ANSWER
+
+
+async def generate_answer_stream(
+    prompt: str, context_chunks: List[str], role: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream the answer text as Gemini produces it.
+
+    Holds a generation slot (rag_config.async_generate_concurrency) for the
+    lifetime of the stream, which must finish within
+    rag_config.generate_timeout_seconds (see stream_with_resilience_async).
+    Yields FALLBACK_ANSWER if the model produced no text.
+    """
+    parts = _build_parts(prompt, context_chunks)
+    produced = False
+    async with _stage_semaphore("generate"):
+        if rag_config.generation_backend == "fake":
+            async for text in _fake_generator().stream(parts):
+                produced = True
+                yield text
+        else:
+            model = _generative_model(rag_config.generation_model, role)
+            timeout = rag_config.generate_timeout_seconds
+            stream = stream_with_resilience_async(
+                "generate",
+                partial(model.generate_content_async, parts, stream=True, request_options={"timeout": timeout}),
+                timeout=timeout,
+            )
+            async with aclosing(stream):
+                async for chunk in stream:
+                    text = chunk.text
+                    if text:
+                        produced = True
+                        yield text
+    if not produced:
+        yield FALLBACK_ANSWER
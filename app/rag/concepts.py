@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import math
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Sequence, Set, Tuple
+
+from .answer_cache import corpus_version
+from .config import rag_config
+
+
+# Canonical concept -> (type, aliases). Matching is on lowercase word n-grams (up to 3 words).
+CONCEPT_LEXICON: Dict[str, Tuple[str, List[str]]] = {
+    # crops
+    "tomato": ("crop", ["tomatoes"]),
+    "potato": ("crop", ["potatoes"]),
+    "onion": ("crop", ["onions"]),
+    "chilli": ("crop", ["chili", "chillies", "chilies", "capsicum"]),
+    "brinjal": ("crop", ["eggplant", "aubergine"]),
+    "okra": ("crop", ["bhindi", "lady finger"]),
+    "cabbage": ("crop", []),
+    "cauliflower": ("crop", []),
+    "rice": ("crop", ["paddy"]),
+    "wheat": ("crop", []),
+    "maize": ("crop", ["corn"]),
+    "millet": ("crop", ["millets", "bajra", "ragi", "jowar", "sorghum"]),
+    "pulses": ("crop", ["chickpea", "gram", "pigeon pea", "tur", "lentil", "moong", "urad"]),
+    "groundnut": ("crop", ["peanut"]),
+    "soybean": ("crop", ["soya", "soybeans"]),
+    "mustard": ("crop", ["rapeseed"]),
+    "cotton": ("crop", []),
+    "sugarcane": ("crop", []),
+    "banana": ("crop", ["bananas"]),
+    "mango": ("crop", ["mangoes"]),
+    "grape": ("crop", ["grapes"]),
+    "citrus": ("crop", ["orange", "oranges", "lemon", "lime"]),
+    "apple": ("crop", ["apples"]),
+    # pests
+    "aphid": ("pest", ["aphids"]),
+    "whitefly": ("pest", ["whiteflies", "bemisia"]),
+    "thrips": ("pest", []),
+    "jassid": ("pest", ["jassids", "leafhopper", "leafhoppers"]),
+    "mite": ("pest", ["mites", "spider mite", "spider mites"]),
+    "fruit borer": ("pest", ["helicoverpa", "fruit borers"]),
+    "stem borer": ("pest", ["stem borers"]),
+    "bollworm": ("pest", ["bollworms", "pink bollworm"]),
+    "fall armyworm": ("pest", ["armyworm", "spodoptera"]),
+    "leaf miner": ("pest", ["leafminer", "leaf miners"]),
+    "nematode": ("pest", ["nematodes", "root knot nematode"]),
+    "locust": ("pest", ["locusts"]),
+    "storage pest": ("pest", ["weevil", "weevils", "rodents", "grain moth"]),
+    # diseases
+    "late blight": ("disease", ["phytophthora", "phytophthora infestans"]),
+    "early blight": ("disease", ["alternaria"]),
+    "leaf curl": ("disease", ["leaf curl virus", "tylcv"]),
+    "mosaic virus": ("disease", ["mosaic"]),
+    "powdery mildew": ("disease", []),
+    "downy mildew": ("disease", []),
+    "bacterial wilt": ("disease", ["ralstonia"]),
+    "fusarium wilt": ("disease", ["fusarium"]),
+    "damping off": ("disease", ["damping-off", "pythium"]),
+    "anthracnose": ("disease", ["colletotrichum"]),
+    "rust": ("disease", ["rusts"]),
+    "blast": ("disease", ["rice blast", "magnaporthe"]),
+    "root rot": ("disease", ["rhizoctonia"]),
+    "post-harvest rot": ("disease", ["rot", "rotting", "decay", "mould", "mold"]),
+    # inputs
+    "urea": ("input", []),
+    "dap": ("input", ["diammonium phosphate"]),
+    "potash": ("input", ["mop", "muriate of potash"]),
+    "npk": ("input", ["npk fertilizer"]),
+    "nitrogen": ("input", []),
+    "phosphorus": ("input", ["phosphate"]),
+    "potassium": ("input", []),
+    "zinc": ("input", ["zinc sulphate", "zinc sulfate"]),
+    "compost": ("input", ["vermicompost", "farmyard manure", "fym", "manure"]),
+    "biofertilizer": ("input", ["biofertilizers", "rhizobium", "azotobacter", "azospirillum"]),
+    "neem": ("input", ["neem oil", "azadirachtin", "neem cake"]),
+    "trichoderma": ("input", []),
+    "mancozeb": ("input", []),
+    "copper oxychloride": ("input", ["copper fungicide", "bordeaux mixture"]),
+    "carbendazim": ("input", []),
+    "imidacloprid": ("input", []),
+    "chlorpyrifos": ("input", []),
+    "pesticide": ("input", ["pesticides", "insecticide", "insecticides"]),
+    "fungicide": ("input", ["fungicides"]),
+    "herbicide": ("input", ["herbicides", "weedicide"]),
+    "irrigation": ("input", ["drip irrigation", "sprinkler"]),
+    # post-harvest / distribution
+    "cold storage": ("storage", ["cold chain", "refrigeration", "refrigerated"]),
+    "packaging": ("storage", ["crates", "packing"]),
+    "transport": ("storage", ["transportation", "logistics"]),
+    "humidity": ("storage", ["relative humidity", "moisture content"]),
+    "temperature": ("storage", []),
+    "shelf life": ("storage", []),
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=1)
+def _alias_map() -> Dict[str, str]:
+    aliases: Dict[str, str] = {}
+    for canonical, (_kind, alts) in CONCEPT_LEXICON.items():
+        for term in [canonical, *alts]:
+            aliases[" ".join(_WORD_RE.findall(term.lower()))] = canonical
+    return aliases
+
+
+def extract_concepts(text: str) -> Set[str]:
+    """Canonical lexicon concepts mentioned in text (single pass over word n-grams)."""
+    words = _WORD_RE.findall(text.lower())
+    aliases = _alias_map()
+    found: Set[str] = set()
+    for i in range(len(words)):
+        for n in (3, 2, 1):
+            gram = " ".join(words[i : i + n])
+            concept = aliases.get(gram)
+            if concept is not None:
+                found.add(concept)
+                break
+    return found
+
+
+class ConceptGraph:
+    """Concept co-occurrence graph built from chunk-level concept mentions.
+
+    chunk -> concepts rows are stored in SQLite (updated incrementally by
+    ingestion). The adjacency index (concept -> neighbours with edge weights,
+    concept -> chunks) is derived from them and held in memory; it is rebuilt
+    whenever the corpus version stamp changes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_concepts ("
+            " chunk_id TEXT NOT NULL,"
+            " concept TEXT NOT NULL,"
+            " PRIMARY KEY (chunk_id, concept))"
+        )
+        self._conn.commit()
+        self._loaded_version: float | None = None
+        self._chunks: Dict[str, List[str]] = {}
+        self._neighbours: Dict[str, Dict[str, float]] = {}
+
+    # --- ingest side -----------------------------------------------------
+
+    def upsert(self, chunks: Sequence[Tuple[str, str]]) -> None:
+        """Extract and store concepts for (chunk_id, text) pairs."""
+        if not chunks:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunk_concepts WHERE chunk_id = ?", [(cid,) for cid, _ in chunks])
+            self._conn.executemany(
+                "INSERT INTO chunk_concepts (chunk_id, concept) VALUES (?, ?)",
+                [(cid, concept) for cid, text in chunks for concept in sorted(extract_concepts(text))],
+            )
+            self._conn.commit()
+            self._loaded_version = None
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunk_concepts WHERE chunk_id = ?", [(cid,) for cid in ids])
+            self._conn.commit()
+            self._loaded_version = None
+
+    # --- query side ------------------------------------------------------
+
+    def _ensure_loaded(self) -> None:
+        version = corpus_version()
+        if self._loaded_version == version:
+            return
+        by_chunk: Dict[str, List[str]] = defaultdict(list)
+        for cid, concept in self._conn.execute("SELECT chunk_id, concept FROM chunk_concepts"):
+            by_chunk[cid].append(concept)
+
+        chunks: Dict[str, List[str]] = defaultdict(list)
+        pair_counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        for cid, concepts in by_chunk.items():
+            for concept in concepts:
+                chunks[concept].append(cid)
+            for a, b in combinations(sorted(concepts), 2):
+                pair_counts[(a, b)] += 1
+
+        # Edge weight: co-occurrence count normalized by both concepts' frequencies (cosine),
+        # so ubiquitous concepts like "nitrogen" do not dominate every expansion.
+        neighbours: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for (a, b), count in pair_counts.items():
+            weight = count / math.sqrt(len(chunks[a]) * len(chunks[b]))
+            neighbours[a][b] = weight
+            neighbours[b][a] = weight
+
+        self._chunks = dict(chunks)
+        self._neighbours = dict(neighbours)
+        self._loaded_version = version
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._ensure_loaded()
+            edges = sum(len(n) for n in self._neighbours.values()) // 2
+            return {"concepts": len(self._chunks), "edges": edges}
+
+    def expand(self, seeds: Set[str], hops: int, max_concepts: int, decay: float) -> Dict[str, float]:
+        """Weighted concept set reachable from seeds within `hops` hops.
+
+        Seeds get weight 1.0; each hop multiplies the edge weight by `decay`.
+        At most `max_concepts` expansion concepts are added per hop.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            weights: Dict[str, float] = {s: 1.0 for s in seeds if s in self._chunks}
+            frontier = dict(weights)
+            for _ in range(hops):
+                candidates: Dict[str, float] = defaultdict(float)
+                for concept, w in frontier.items():
+                    for neighbour, edge in self._neighbours.get(concept, {}).items():
+                        if neighbour not in weights:
+                            candidates[neighbour] = max(candidates[neighbour], w * edge * decay)
+                best = sorted(candidates.items(), key=lambda item: item[1], reverse=True)[:max_concepts]
+                frontier = dict(best)
+                weights.update(frontier)
+            return weights
+
+    def rank_chunks(self, weights: Dict[str, float], k: int) -> List[str]:
+        """Chunk IDs ordered by the summed weight of the concepts they mention."""
+        with self._lock:
+            scores: Dict[str, float] = defaultdict(float)
+            for concept, w in weights.items():
+                for cid in self._chunks.get(concept, []):
+                    scores[cid] += w
+        return sorted(scores, key=lambda cid: scores[cid], reverse=True)[:k]
+
+
+@lru_cache(maxsize=1)
+def get_concept_graph() -> ConceptGraph:
+    return ConceptGraph(rag_config.concept_graph_path)
+
+
+def graph_ranked_ids(query: str, k: int) -> List[str]:
+    """Chunk IDs relevant to the query's concepts and their graph neighbourhood.
+
+    Purely local: no embedding or network calls.
+    """
+    seeds = extract_concepts(query)
+    if not seeds or rag_config.graph_expansion_hops <= 0:
+        return []
+    graph = get_concept_graph()
+    weights = graph.expand(
+        seeds,
+        hops=min(rag_config.graph_expansion_hops, 2),
+        max_concepts=rag_config.graph_max_expansion,
+        decay=rag_config.graph_hop_decay,
+    )
+    return graph.rank_chunks(weights, k)
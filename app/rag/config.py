@@ -1,3 +1,5 @@
+from typing import List, Literal
+
 from pydantic import BaseModel
 
 
@@ -8,8 +10,108 @@ class RagConfig(BaseModel):
     persist_directory: str = "./chroma_db"
     embedding_model: str = "models/text-embedding-004"  # Gemini embedding
     generation_model: str = "gemini-2.0-flash"  # Gemini 2.0 Flash
+    # Pluggable backends: "hashing"/"fake" run fully offline (benchmarks, development)
+    embedding_backend: Literal["gemini", "hashing"] = "gemini"
+    generation_backend: Literal["gemini", "fake"] = "gemini"
+    hashing_embedding_dim: int = 768
+    fake_generation_delay: float = 0.5  # seconds per fake generation
+
     top_k: int = 8
-    min_relevance_score: float = 0.2
+    min_relevance_score: float = 0.2  # cosine similarity floor for vector hits
+
+    # Context assembly: dedup/MMR/packing of retrieved chunks into a fixed prompt budget
+    context_token_budget: int = 1500
+    context_dedup_threshold: float = 0.8  # token Jaccard above which chunks count as duplicates
+    mmr_lambda: float = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+    chars_per_token: int = 4
+
+    # Retrieval: "vector" (Chroma), "lexical" (local BM25, no network) or "hybrid" (both, fused by RRF)
+    retrieval_mode: Literal["vector", "lexical", "hybrid"] = "hybrid"
+    lexical_index_path: str = "./chroma_db/bm25_index.sqlite3"
+    rrf_k: int = 60
+    # Vector engine behind "vector"/"hybrid": Chroma (HNSW) or exact search over a memory-mapped
+    # NumPy matrix. Both are kept up to date at ingest, so switching needs no re-ingest.
+    vector_engine: Literal["chroma", "numpy"] = "chroma"
+    numpy_index_dir: str = "./chroma_db/numpy_index"
+    # NumPy engine storage: the scanned matrix can be reduced (PCA fitted on the corpus, or
+    # Matryoshka truncation) and int8-quantized; top candidates are rescored at full precision.
+    # Changing these re-encodes the index on the next ingest.
+    vector_reduction: Literal["none", "pca", "truncate"] = "none"
+    vector_reduced_dim: int = 256
+    vector_quantization: Literal["float32", "int8"] = "float32"
+    vector_rescore_candidates: int = 64
+
+    # Near-duplicate chunks (boilerplate, repeated abstracts) are dropped at ingest by MinHash-LSH:
+    # the first chunk seen is indexed and later ones are recorded as its aliases
+    dedup_enabled: bool = True
+    dedup_index_path: str = "./chroma_db/dedup_index.sqlite3"
+    dedup_jaccard_threshold: float = 0.8  # estimated Jaccard similarity of word 3-shingles
+    dedup_shingle_words: int = 3
+    dedup_num_perm: int = 128
+    dedup_bands: int = 16  # 8 rows per band: pairs above ~0.7 similarity become candidates
+
+    # Topic partitions: chunks are tagged with topics (use_case labels) and crops at ingest;
+    # questions with a use_case search only that partition if it has partition_min_chunks chunks
+    partition_routing: bool = True
+    partition_by_crop: bool = True  # also narrow to the crops the question mentions
+    partition_min_chunks: int = 30
+    topic_min_hits: int = 2
+
+    # Concept graph (crops, pests, diseases, inputs) used to expand queries by 1-2 hops
+    concept_graph_path: str = "./chroma_db/concept_graph.sqlite3"
+    graph_expansion_hops: int = 1  # 0 disables graph expansion, capped at 2
+    graph_max_expansion: int = 8  # expansion concepts added per hop
+    graph_hop_decay: float = 0.5
+
+    # Embedding batching: Gemini's batchEmbedContents accepts at most 100 texts per call
+    embed_batch_size: int = 100
+    embed_batch_max_chars: int = 200_000
+    embed_max_concurrency: int = 4
+    embed_max_retries: int = 5
+    embed_retry_base_delay: float = 1.0  # seconds, doubled on every retry
+
+    # Query embedding micro-batching: concurrent single-question embeds within the window share
+    # one API call (0 ms or max size 1 disables)
+    query_batch_window_ms: float = 5.0
+    query_batch_max_size: int = 32
+
+    # Resilience around Gemini calls: per-call deadlines, hedged duplicates after the recent
+    # p95 latency (stages listed in hedge_stages), and a circuit breaker per stage
+    embed_timeout_seconds: float = 10.0
+    generate_timeout_seconds: float = 30.0
+    hedge_stages: List[Literal["embed", "generate"]] = ["embed"]
+    hedge_min_delay: float = 0.05
+    hedge_min_samples: int = 20
+    hedge_pool_workers: int = 8
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    degraded_cache_similarity: float = 0.85  # answer-cache threshold while generation is unavailable
+
+    # Bulk answering (/ai/farmer/batch): near-duplicate questions share retrieved context
+    batch_max_questions: int = 200
+    batch_duplicate_similarity: float = 0.92
+    batch_generate_concurrency: int = 8
+
+    # Async request path: per-stage concurrency limits for /ai endpoints
+    async_embed_concurrency: int = 8
+    chroma_executor_workers: int = 4
+    async_generate_concurrency: int = 8
+
+    # Content-addressed embedding cache (SQLite on disk + in-process LRU)
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "./chroma_db/embedding_cache.sqlite3"
+    embedding_cache_max_entries: int = 200_000
+    embedding_cache_memory_entries: int = 5_000
+
+    # Answer cache for answer_with_graph_rag (exact + nearest-neighbour on question embeddings)
+    answer_cache_enabled: bool = True
+    answer_cache_max_entries: int = 2_000
+    answer_cache_ttl_seconds: float = 3 * 24 * 3600
+    answer_cache_similarity_threshold: float = 0.95
+    corpus_version_path: str = "./chroma_db/corpus_version"  # touched by ingestion
+
+    # Records per-PDF content hash, chunking parameters and chunk IDs for incremental ingestion
+    ingest_manifest_path: str = "./chroma_db/ingest_manifest.json"
 
 
 rag_config = RagConfig()
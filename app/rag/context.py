@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, FrozenSet, List, Optional, Tuple
+
+from .config import rag_config
+from .lexical import tokenize
+
+if TYPE_CHECKING:  # pragma: no cover - import only for type hints (avoids a cycle)
+    from .graph_rag import RagChunk
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (no tokenizer round trip): ~4 characters per token."""
+    return max(1, len(text) // rag_config.chars_per_token)
+
+
+def relevance_from_distance(distance: Optional[float]) -> Optional[float]:
+    """Cosine similarity implied by a Chroma L2 distance between unit vectors.
+
+    Chroma's default space is squared L2; for normalized embeddings that is
+    2 - 2*cos. Returns None for hits without a distance (lexical/graph hits).
+    """
+    if distance is None:
+        return None
+    return 1.0 - distance / 2.0
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def assemble_context(ranked: List["RagChunk"], token_budget: Optional[int] = None) -> Tuple[List["RagChunk"], int]:
+    """Turn ranked retrieval candidates into the context actually sent to Gemini.
+
+    1. drop vector hits below rag_config.min_relevance_score;
+    2. drop near-duplicates of better-ranked chunks (token Jaccard);
+    3. reorder by maximal marginal relevance so similar chunks do not crowd
+       out other aspects of the question;
+    4. pack chunks in that order while they fit within the token budget.
+
+    Returns (chunks, estimated tokens).
+    """
+    budget = token_budget if token_budget is not None else rag_config.context_token_budget
+
+    candidates: List["RagChunk"] = []
+    for chunk in ranked:
+        relevance = relevance_from_distance(chunk.distance)
+        if relevance is not None and relevance < rag_config.min_relevance_score:
+            continue
+        candidates.append(chunk)
+
+    terms = [frozenset(tokenize(c.text)) for c in candidates]
+    unique: List[int] = []
+    for i in range(len(candidates)):
+        if all(_jaccard(terms[i], terms[j]) < rag_config.context_dedup_threshold for j in unique):
+            unique.append(i)
+
+    # Rank-based relevance in (0, 1]: the fused order is the best relevance signal we have.
+    n = len(unique)
+    relevance = {idx: 1.0 - pos / max(n, 1) for pos, idx in enumerate(unique)}
+    lam = rag_config.mmr_lambda
+    order: List[int] = []
+    remaining = list(unique)
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: lam * relevance[i]
+            - (1 - lam) * max((_jaccard(terms[i], terms[j]) for j in order), default=0.0),
+        )
+        order.append(best)
+        remaining.remove(best)
+
+    packed: List["RagChunk"] = []
+    used = 0
+    for i in order:
+        cost = estimate_tokens(candidates[i].text)
+        if used + cost > budget:
+            continue  # a smaller, lower-ranked chunk may still fit
+        packed.append(candidates[i])
+        used += cost
+    return packed, used
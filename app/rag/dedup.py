@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .config import rag_config
+
+
+# Bump when shingling/hashing changes so stored signatures are discarded.
+DEDUP_VERSION = 1
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def dedup_params() -> Dict[str, Any]:
+    """Everything that changes signatures or matches; part of the ingest manifest."""
+    return {
+        "version": DEDUP_VERSION,
+        "enabled": rag_config.dedup_enabled,
+        "num_perm": rag_config.dedup_num_perm,
+        "bands": rag_config.dedup_bands,
+        "shingle_words": rag_config.dedup_shingle_words,
+        "threshold": rag_config.dedup_jaccard_threshold,
+    }
+
+
+@lru_cache(maxsize=4)
+def _permutations(num_perm: int) -> np.ndarray:
+    """Fixed (a, b) pairs of the universal hashes h(x) = (a*x + b) mod p, as a (2, num_perm) array."""
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return np.stack([a, b])
+
+
+def _shingles(text: str, n: int) -> Set[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (uint32 per permutation) of the text's word shingles; None for empty text."""
+    shingles = _shingles(text, rag_config.dedup_shingle_words)
+    if not shingles:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    a, b = _permutations(rag_config.dedup_num_perm)
+    # 32-bit inputs and multipliers keep a*x + b below 2**64, so uint64 arithmetic never wraps.
+    permuted = (hashes[:, None] * a + b) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """MinHash-LSH index of the representative chunks, plus the aliases dropped in their favour.
+
+    Each signature is cut into rag_config.dedup_bands bands; chunks sharing any
+    band bucket are candidates, confirmed when their estimated Jaccard
+    similarity reaches rag_config.dedup_jaccard_threshold. Stored in SQLite
+    next to the other side indexes and updated incrementally by ingestion.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            " chunk_id TEXT PRIMARY KEY, source_file TEXT NOT NULL, signature BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " band INTEGER NOT NULL, bucket TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " PRIMARY KEY (band, bucket, chunk_id));"
+            "CREATE INDEX IF NOT EXISTS buckets_chunk ON buckets (chunk_id);"
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            " alias_id TEXT PRIMARY KEY, representative_id TEXT NOT NULL,"
+            " source_file TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS aliases_representative ON aliases (representative_id);"
+            "CREATE INDEX IF NOT EXISTS aliases_source ON aliases (source_file);"
+        )
+        params = json.dumps({k: v for k, v in dedup_params().items() if k in ("version", "num_perm", "bands")})
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+        if row is None or row[0] != params:
+            # Signatures from other parameters are not comparable; ingestion re-adds every file.
+            self._conn.executescript("DELETE FROM signatures; DELETE FROM buckets; DELETE FROM aliases;")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (params,))
+        self._conn.commit()
+
+    def _bands(self, signature: np.ndarray) -> List[str]:
+        return [band.tobytes().hex() for band in np.array_split(signature, rag_config.dedup_bands)]
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """ID of an indexed representative that is a near-duplicate of the signature, if any."""
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, bucket in enumerate(self._bands(signature)):
+                rows = self._conn.execute(
+                    "SELECT chunk_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                )
+                candidates.update(r[0] for r in rows)
+            best, best_score = None, rag_config.dedup_jaccard_threshold
+            for cid in sorted(candidates):
+                row = self._conn.execute("SELECT signature FROM signatures WHERE chunk_id = ?", (cid,)).fetchone()
+                score = estimated_jaccard(signature, np.frombuffer(row[0], dtype=np.uint32))
+                if score >= best_score:
+                    best, best_score = cid, score
+            return best
+
+    # add() and add_alias() leave the transaction open (this connection's own
+    # find() already sees the rows); ingestion calls commit() once per file.
+
+    def add(self, chunk_id: str, source_file: str, signature: np.ndarray) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO signatures (chunk_id, source_file, signature) VALUES (?, ?, ?)",
+                (chunk_id, source_file, signature.tobytes()),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO buckets (band, bucket, chunk_id) VALUES (?, ?, ?)",
+                [(band, bucket, chunk_id) for band, bucket in enumerate(self._bands(signature))],
+            )
+
+    def add_alias(self, alias_id: str, representative_id: str, source_file: str, metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aliases (alias_id, representative_id, source_file, metadata)"
+                " VALUES (?, ?, ?, ?)",
+                (alias_id, representative_id, source_file, json.dumps(metadata)),
+            )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def aliases_of(self, representative_ids: Sequence[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """(alias ID, source file) pairs of the chunks dropped in favour of each representative."""
+        found: Dict[str, List[Tuple[str, str]]] = {rid: [] for rid in representative_ids}
+        ids = list(found)
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                part = ids[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT representative_id, alias_id, source_file FROM aliases"
+                    f" WHERE representative_id IN ({','.join('?' * len(part))}) ORDER BY alias_id",
+                    part,
+                ).fetchall()
+                for rid, alias_id, source_file in rows:
+                    found[rid].append((alias_id, source_file))
+        return found
+
+    def signatures(self, source_file: str) -> Dict[str, np.ndarray]:
+        """Signatures of a file's current representatives, by chunk ID."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, signature FROM signatures WHERE source_file = ?", (source_file,)
+            ).fetchall()
+        return {cid: np.frombuffer(sig, dtype=np.uint32) for cid, sig in rows}
+
+    def release(self, chunk_id: str) -> Set[str]:
+        """Drop the aliases of a representative whose text changed; returns the files they belong to."""
+        with self._lock:
+            orphaned = self._release_locked(chunk_id)
+            self._conn.commit()
+            return orphaned
+
+    def _release_locked(self, chunk_id: str) -> Set[str]:
+        rows = self._conn.execute("SELECT source_file FROM aliases WHERE representative_id = ?", (chunk_id,))
+        orphaned = {r[0] for r in rows}
+        self._conn.execute("DELETE FROM aliases WHERE representative_id = ?", (chunk_id,))
+        return orphaned
+
+    def forget_file(self, source_file: str) -> Set[str]:
+        """Drop a file's signatures and aliases before it is re-ingested (its chunks stay indexed).
+
+        Returns the representatives that lost aliases, whose duplicate metadata is now stale.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT representative_id FROM aliases WHERE source_file = ?", (source_file,)
+            )
+            touched = {r[0] for r in rows}
+            self._conn.execute(
+                "DELETE FROM buckets WHERE chunk_id IN (SELECT chunk_id FROM signatures WHERE source_file = ?)",
+                (source_file,),
+            )
+            self._conn.execute("DELETE FROM signatures WHERE source_file = ?", (source_file,))
+            self._conn.execute("DELETE FROM aliases WHERE source_file = ?", (source_file,))
+            self._conn.commit()
+            return touched
+
+    def delete(self, ids: Sequence[str]) -> Set[str]:
+        """Remove deleted representatives; returns the files whose aliases pointed at them.
+
+        Those files have lost the indexed copy of some of their text and must be re-ingested.
+        """
+        if not ids:
+            return set()
+        with self._lock:
+            orphaned: Set[str] = set()
+            for cid in ids:
+                orphaned |= self._release_locked(cid)
+                self._conn.execute("DELETE FROM buckets WHERE chunk_id = ?", (cid,))
+                self._conn.execute("DELETE FROM signatures WHERE chunk_id = ?", (cid,))
+            self._conn.commit()
+            return orphaned
+
+
+@lru_cache(maxsize=1)
+def get_dedup_index() -> NearDuplicateIndex:
+    return NearDuplicateIndex(rag_config.dedup_index_path)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import rag_config
+
+
+# Disk hits record their last_used time in memory; it is written with the next
+# put_many or once this many keys are pending, never with a commit per read.
+_TOUCH_FLUSH_SIZE = 256
+
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+    """Content address of an embedding: sha256 over (model, task_type, text)."""
+    h = hashlib.sha256()
+    for part in (model, task_type, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    arr = array("f")
+    arr.frombytes(blob)
+    return arr.tolist()
+
+
+class EmbeddingCache:
+    """Two-level embedding cache: an in-process LRU over a SQLite table.
+
+    Vectors are stored as float32 blobs keyed by `cache_key`. The SQLite layer
+    is capped at `max_entries` rows; when the cap is exceeded the least
+    recently used rows are evicted down to 90% of the cap. Reads only update
+    last_used in batches (see _TOUCH_FLUSH_SIZE), so recency is approximate
+    and may lose the last few reads on exit.
+    """
+
+    def __init__(self, path: str, max_entries: int, memory_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}  # key -> last_used not yet written
+        self._stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: str, vec: List[float]) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for the given keys (missing keys are omitted)."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            pending: List[str] = []
+            for key in keys:
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vec
+                    self._stats["memory_hits"] += 1
+                else:
+                    pending.append(key)
+
+            now = time.time()
+            disk_hits = 0
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(pending), 500):
+                part = pending[start : start + 500]
+                placeholders = ",".join("?" for _ in part)
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vec = _unpack(blob)
+                    found[key] = vec
+                    self._remember(key, vec)
+                    self._touched[key] = now
+                    disk_hits += 1
+
+            if len(self._touched) >= _TOUCH_FLUSH_SIZE:
+                self._flush_touched()
+                self._conn.commit()
+            self._stats["disk_hits"] += disk_hits
+            self._stats["misses"] += len(pending) - disk_hits
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Store vectors, evicting least recently used rows beyond the size cap."""
+        items = {k: v for k, v in items.items() if v}
+        if not items:
+            return
+        with self._lock:
+            now = time.time()
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, _pack(v), now) for k, v in items.items()],
+            )
+            self._rows += self._conn.total_changes - before
+            for key, vec in items.items():
+                self._remember(key, vec)
+            self._stats["writes"] += len(items)
+            self._flush_touched()
+
+            if self._rows > self.max_entries:
+                target = int(self.max_entries * 0.9)
+                excess = self._rows - target
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                )
+                self._rows -= excess
+                self._stats["evictions"] += excess
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._rows = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since process start plus current sizes."""
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "lookups": hits + self._stats["misses"],
+                "memory_entries": len(self._memory),
+                "disk_entries": self._rows,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide embedding cache, or None when disabled in RagConfig."""
+    if not rag_config.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(
+        path=rag_config.embedding_cache_path,
+        max_entries=rag_config.embedding_cache_max_entries,
+        memory_entries=rag_config.embedding_cache_memory_entries,
+    )
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {}
@@ -1,10 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import re
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 
-from .client import get_or_create_collection, embed_texts, generate_answer
+import numpy as np
+
+from .answer_cache import corpus_version, get_answer_cache, normalize_question
+from .client import (
+    FALLBACK_ANSWER,
+    get_or_create_collection,
+    embed_query,
+    embed_query_async,
+    embed_texts,
+    embed_texts_async,
+    generate_answer,
+    generate_answer_async,
+    generate_answer_stream,
+    run_in_chroma_executor,
+)
+from .concepts import get_concept_graph, graph_ranked_ids
 from .config import rag_config
+from .context import assemble_context
+from .lexical import get_lexical_index, reciprocal_rank_fusion
+from .metrics import increment, timed
+from .resilience import ProviderUnavailable
+from .topics import Partition, candidate_partitions, topic_metadata
+from .vector_index import get_numpy_index
+
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
 
 
 @dataclass
@@ -12,61 +41,349 @@ class RagChunk:
     id: str
     text: str
     metadata: Dict[str, Any]
+    distance: Optional[float] = None  # set for vector search hits (lower is better)
+
+
+def _chroma_stores_vectors() -> bool:
+    """False when the reduced/quantized NumPy index serves vector queries.
+
+    Chroma would then only hold an unused full float32 copy of every vector
+    (plus its HNSW graph), so it is not written at all.
+    """
+    compact = rag_config.vector_reduction != "none" or rag_config.vector_quantization != "float32"
+    return not (rag_config.vector_engine == "numpy" and compact)
 
 
 def index_chunks(chunks: List[RagChunk]) -> None:
-    """Index text chunks into Chroma for retrieval.
+    """Index text chunks into Chroma, the NumPy vector index, the local BM25 index and the concept graph.
 
     This is intended to be called from an offline ingestion script that parses PDFs.
+    Chunk IDs are deterministic, so chunks are upserted: re-indexing a changed
+    file overwrites its previous chunks instead of failing on duplicate IDs.
+    Chroma is skipped when the compact NumPy index serves queries (see
+    _chroma_stores_vectors).
     """
     if not chunks:
         return
 
-    collection = get_or_create_collection(rag_config.collection_name)
     texts = [c.text for c in chunks]
     ids = [c.id for c in chunks]
-    metadatas = [c.metadata for c in chunks]
+    # Topic/crop tags let retrieval search only the partition a question belongs to
+    metadatas = [{**c.metadata, **topic_metadata(c.text)} for c in chunks]
 
     embeddings = embed_texts(texts)
-    collection.add(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    if _chroma_stores_vectors():
+        collection = get_or_create_collection(rag_config.collection_name)
+        collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    get_numpy_index().upsert(list(zip(ids, texts, metadatas, embeddings)))
+    get_lexical_index().upsert(list(zip(ids, texts, metadatas)))
+    get_concept_graph().upsert([(c.id, c.text) for c in chunks])
 
 
-def _search_chunks(query: str, top_k: Optional[int] = None) -> List[RagChunk]:
+def delete_chunks(ids: List[str]) -> None:
+    """Remove chunks (e.g. of a deleted or shrunk source file) from the index."""
+    if not ids:
+        return
     collection = get_or_create_collection(rag_config.collection_name)
-    k = top_k or rag_config.top_k
-    query_embeddings = embed_texts([query])
-    if not query_embeddings:
-        return []
+    collection.delete(ids=ids)
+    get_numpy_index().delete(ids)
+    get_lexical_index().delete(ids)
+    get_concept_graph().delete(ids)
+
+
+def update_chunk_metadata(updates: Dict[str, Dict[str, Any]]) -> None:
+    """Merge metadata keys into already indexed chunks, by chunk ID, without re-embedding them."""
+    if not updates:
+        return
+    if _chroma_stores_vectors():
+        collection = get_or_create_collection(rag_config.collection_name)
+        current = collection.get(ids=list(updates), include=["metadatas"])
+        if current["ids"]:
+            collection.update(
+                ids=current["ids"],
+                metadatas=[{**(meta or {}), **updates[cid]} for cid, meta in zip(current["ids"], current["metadatas"])],
+            )
+    get_numpy_index().update_metadata(updates)
+    get_lexical_index().update_metadata(updates)
+
+
+def vector_storage_footprint() -> Dict[str, Any]:
+    """Bytes held by the vector stores: the NumPy index (see NumpyVectorIndex.footprint) plus Chroma.
 
-    results = collection.query(
+    Chroma's resident share is its HNSW segment files, which it loads into memory.
+    """
+    numpy_index = get_numpy_index().footprint()
+    persist = Path(rag_config.persist_directory).resolve()
+    numpy_dir = Path(rag_config.numpy_index_dir).resolve()
+    chroma_disk = chroma_resident = 0
+    for root, _, files in os.walk(persist):
+        if numpy_dir == Path(root) or numpy_dir in Path(root).parents:
+            continue
+        for name in files:
+            size = (Path(root) / name).stat().st_size
+            chroma_disk += size
+            chroma_resident += size if name.endswith(".bin") else 0
+    return {
+        "numpy": numpy_index,
+        "chroma_disk_bytes": chroma_disk,
+        "chroma_resident_bytes": chroma_resident,
+        "total_disk_bytes": numpy_index["total_disk_bytes"] + chroma_disk,
+        "total_resident_bytes": numpy_index["resident_bytes"] + chroma_resident,
+    }
+
+
+def _embed_question(question: str) -> Optional[List[float]]:
+    """Embedding used by the answer cache; shares the embedding cache with retrieval."""
+    try:
+        vector = embed_query(question)
+    except Exception as exc:  # the answer cache must never break answering
+        print("[RAG] Could not embed question for answer cache:", exc)
+        return None
+    return vector or None
+
+
+async def _embed_question_async(question: str) -> Optional[List[float]]:
+    try:
+        vector = await embed_query_async(question)
+    except Exception as exc:  # the answer cache must never break answering
+        print("[RAG] Could not embed question for answer cache:", exc)
+        return None
+    return vector or None
+
+
+@timed("chroma_query")
+def _query_chroma(
+    query_embeddings: List[List[float]], k: int, partition: Optional[Partition] = None
+) -> Dict[str, Any]:
+    collection = get_or_create_collection(rag_config.collection_name)
+    return collection.query(
         query_embeddings=query_embeddings,
         n_results=k,
+        where=partition.chroma_where() if partition is not None else None,
     )
 
-    docs = results.get("documents", [[]])[0]
-    ids = results.get("ids", [[]])[0]
-    metadatas = results.get("metadatas", [[]])[0]
-    distances = results.get("distances") or results.get("embeddings")
+
+@timed("numpy_query")
+def _query_numpy(
+    query_embeddings: List[List[float]], k: int, partition: Optional[Partition] = None
+) -> Dict[str, Any]:
+    return get_numpy_index().query(query_embeddings, k, partition=partition)
+
+
+def _query_collection(
+    query_embeddings: List[List[float]], k: int, partition: Optional[Partition] = None
+) -> Dict[str, Any]:
+    """Vector search on the engine selected by rag_config.vector_engine (Chroma-shaped results)."""
+    if rag_config.vector_engine == "numpy":
+        return _query_numpy(query_embeddings, k, partition)
+    return _query_chroma(query_embeddings, k, partition)
+
+
+def _vector_ranked(results: Dict[str, Any], query_index: int = 0) -> List[RagChunk]:
+    """Vector query results (Chroma or NumPy engine) as RagChunks, most relevant first.
+
+    `query_index` selects one query's hits when several embeddings were queried at once.
+    """
+    docs = results.get("documents", [[]])[query_index]
+    ids = results.get("ids", [[]])[query_index]
+    metadatas = results.get("metadatas", [[]])[query_index]
+    distances = results.get("distances") or [[]]
+    dist_list = distances[query_index] if distances and isinstance(distances[query_index], list) else []
 
     rag_chunks: List[RagChunk] = []
     for i, (cid, doc, meta) in enumerate(zip(ids, docs, metadatas)):
-        # Chroma returns distances or similarity scores depending on config. We do a simple presence check.
         if not doc:
             continue
-        rag_chunks.append(RagChunk(id=cid, text=doc, metadata=meta or {}))
-
-    # Only keep the single most relevant chunk and ignore the rest.
-    if not rag_chunks:
-        return []
+        distance = dist_list[i] if i < len(dist_list) else None
+        rag_chunks.append(RagChunk(id=cid, text=doc, metadata=meta or {}, distance=distance))
 
-    # If Chroma returned distances (lower is better), pick the smallest one;
+    # If Chroma returned distances (lower is better), order by them;
     # otherwise, assume the results are already sorted by relevance.
-    if isinstance(distances, list) and distances and isinstance(distances[0], list) and distances[0]:
-        dist_list = distances[0]
-        best_idx = min(range(len(rag_chunks)), key=lambda i: dist_list[i] if i < len(dist_list) else float("inf"))
-        return [rag_chunks[best_idx]]
+    return sorted(rag_chunks, key=lambda c: c.distance if c.distance is not None else float("inf"))
+
+
+def _lexical_ranked(query: str, k: int, partition: Optional[Partition] = None) -> List[RagChunk]:
+    return [
+        RagChunk(id=cid, text=text, metadata=meta)
+        for cid, text, meta, _score in get_lexical_index().search(query, k, partition=partition)
+    ]
+
+
+def _graph_ranked(query: str, k: int, partition: Optional[Partition] = None) -> List[RagChunk]:
+    """Chunks reached through the query's concepts and their graph neighbours (no network)."""
+    ids = graph_ranked_ids(query, k if partition is None else 4 * k)
+    docs = get_lexical_index().get(ids)
+    ranked = [RagChunk(id=cid, text=docs[cid][0], metadata=docs[cid][1]) for cid in ids if cid in docs]
+    if partition is not None:
+        ranked = [c for c in ranked if partition.matches(c.metadata)]
+    return ranked[:k]
+
+
+def _local_rankings(query: str, k: int, mode: str, partition: Optional[Partition] = None) -> List[List[RagChunk]]:
+    """Rankings that need no network: BM25 (hybrid/lexical) and the concept graph."""
+    if mode not in ("hybrid", "lexical"):
+        return [_graph_ranked(query, k, partition)]
+    return [_lexical_ranked(query, k, partition), _graph_ranked(query, k, partition)]
+
+
+@lru_cache(maxsize=256)
+def _partition_size(version: float, partition: Partition) -> int:
+    """Chunks in a partition; keyed on the corpus version so re-ingesting refreshes it (lru_cache is thread-safe)."""
+    return get_lexical_index().count(partition)
+
+
+def _route_partition(query: str, use_case: Optional[str]) -> Optional[Partition]:
+    """Narrowest topic/crop partition for the question that holds enough chunks (None = full index)."""
+    version = corpus_version()
+    for partition in candidate_partitions(query, use_case):
+        if _partition_size(version, partition) >= rag_config.partition_min_chunks:
+            increment("partition_routed")
+            return partition
+    if use_case:
+        increment("partition_fallback")
+    return None
+
+
+def _fuse(*rankings: List[RagChunk]) -> List[RagChunk]:
+    """Reciprocal rank fusion of several rankings (vector hits first to keep their distance)."""
+    rankings = tuple(r for r in rankings if r)
+    if len(rankings) <= 1:
+        return rankings[0] if rankings else []
+    by_id: Dict[str, RagChunk] = {}
+    for ranking in reversed(rankings):
+        by_id.update({c.id: c for c in ranking})
+    fused = reciprocal_rank_fusion([[c.id for c in r] for r in rankings], k=rag_config.rrf_k)
+    return [by_id[cid] for cid in fused]
+
+
+def _select_chunks(ranked: List[RagChunk]) -> List[RagChunk]:
+    """Filter, deduplicate, diversify and pack candidates into the context budget."""
+    chunks, tokens = assemble_context(ranked)
+    print(
+        f"[RAG] Context packed: {len(chunks)}/{len(ranked)} chunks, "
+        f"~{tokens}/{rag_config.context_token_budget} tokens"
+    )
+    return chunks
+
+
+def _search_chunks(query: str, top_k: Optional[int] = None, use_case: Optional[str] = None) -> List[RagChunk]:
+    """Retrieve context according to rag_config.retrieval_mode.
+
+    "vector" queries Chroma, "lexical" uses only the local BM25 index (no
+    network calls), and "hybrid" fuses both. In hybrid mode a failing
+    embedding call degrades to the lexical results. Every mode also fuses in
+    chunks found by expanding the query's concepts over the concept graph.
+
+    With a use_case, every ranking is restricted to the matching topic (and
+    mentioned crops) partition, unless it is too sparse (see _route_partition)
+    or yields no usable context, in which case the full index is searched.
+    """
+    k = top_k or rag_config.top_k
+    partition = _route_partition(query, use_case)
+    chunks = _search_partition(query, k, partition)
+    if not chunks and partition is not None:
+        increment("partition_fallback")
+        chunks = _search_partition(query, k, None)
+    return chunks
+
+
+def _search_partition(query: str, k: int, partition: Optional[Partition]) -> List[RagChunk]:
+    mode = rag_config.retrieval_mode
+    local = _local_rankings(query, k, mode, partition)
+    if mode == "lexical":
+        return _select_chunks(_fuse(*local))
+
+    try:
+        query_embeddings = [embed_query(query)]
+    except Exception as exc:
+        if mode != "hybrid" and not isinstance(exc, ProviderUnavailable):
+            raise
+        print("[RAG] Embedding failed, answering retrieval from the lexical index:", exc)
+        if mode != "hybrid":
+            local = [_lexical_ranked(query, k, partition), *local]
+        return _select_chunks(_fuse(*local))
+    if not query_embeddings[0]:
+        return _select_chunks(_fuse(*local))
+    vector = _vector_ranked(_query_collection(query_embeddings, k, partition))
+    return _select_chunks(_fuse(vector, *local))
+
+
+async def _search_chunks_async(
+    query: str, top_k: Optional[int] = None, use_case: Optional[str] = None
+) -> List[RagChunk]:
+    """Async twin of _search_chunks: async embedding, local stores on the Chroma executor."""
+    k = top_k or rag_config.top_k
+    partition = await run_in_chroma_executor(_route_partition, query, use_case)
+    chunks = await _search_partition_async(query, k, partition)
+    if not chunks and partition is not None:
+        increment("partition_fallback")
+        chunks = await _search_partition_async(query, k, None)
+    return chunks
+
+
+async def _search_partition_async(query: str, k: int, partition: Optional[Partition]) -> List[RagChunk]:
+    mode = rag_config.retrieval_mode
+    local = await run_in_chroma_executor(_local_rankings, query, k, mode, partition)
+    if mode == "lexical":
+        return _select_chunks(_fuse(*local))
+
+    try:
+        query_embeddings = [await embed_query_async(query)]
+    except Exception as exc:
+        if mode != "hybrid" and not isinstance(exc, ProviderUnavailable):
+            raise
+        print("[RAG] Embedding failed, answering retrieval from the lexical index:", exc)
+        if mode != "hybrid":
+            local = [await run_in_chroma_executor(_lexical_ranked, query, k, partition), *local]
+        return _select_chunks(_fuse(*local))
+    if not query_embeddings[0]:
+        return _select_chunks(_fuse(*local))
+    results = await run_in_chroma_executor(_query_collection, query_embeddings, k, partition)
+    return _select_chunks(_fuse(_vector_ranked(results), *local))
+
+
+@timed("prompt_build")
+def _build_prompt(question: str, role: str, use_case: Optional[str]) -> str:
+    """Build the per-request prompt.
+
+    The role notes and answering style are static per role and live in the
+    model's system instruction (see client.system_instruction).
+    """
+    if use_case:
+        return (
+            f"This question is categorized as: {use_case}. Prioritize answering that aspect."
+            f"\n\nQuestion: {question}"
+        )
+    return f"Question: {question}"
+
+
+def _extractive_answer(chunks: List[RagChunk]) -> str:
+    """Answer assembled from the retrieved text alone, used while Gemini is unavailable."""
+    if not chunks:
+        return FALLBACK_ANSWER
+    points = []
+    for chunk in chunks[:3]:
+        sentences = _SENTENCE_RE.split(" ".join(chunk.text.split()))
+        points.append("- " + " ".join(sentences[:2])[:400])
+    return (
+        "**Quick guidance**\n"
+        + "\n".join(points)
+        + "\n\nI can give a more detailed answer a little later. Would you like me to try again then?"
+    )
+
 
-    return rag_chunks[:1]
+def _degraded_answer(
+    role: str, use_case: Optional[str], chunks: List[RagChunk], embedding: Optional[List[float]]
+) -> str:
+    """Best answer without generation: a close cached answer, else an extractive one. Never cached."""
+    increment("degraded_answers")
+    cache = get_answer_cache()
+    if cache is not None:
+        cached = cache.get_similar(role, use_case, embedding, threshold=rag_config.degraded_cache_similarity)
+        if cached is not None:
+            increment("degraded_cache_answers")
+            return cached
+    return _extractive_answer(chunks)
 
 
 def answer_with_graph_rag(question: str, role: str, use_case: Optional[str] = None) -> str:
@@ -78,35 +395,244 @@ def answer_with_graph_rag(question: str, role: str, use_case: Optional[str] = No
       but without context (the caller should treat this as transparent to the user).
 
     The caller (router) is responsible for providing role (farmer/distributor).
+    Answers are cached per (role, use_case, question); see answer_cache.
     """
+    cache = get_answer_cache()
+    if cache is not None:
+        cached = cache.get(role, use_case, question, embed=_embed_question)
+        if cached is not None:
+            return cached
+
     # Step 1: retrieve context
-    chunks = _search_chunks(question, top_k=rag_config.top_k)
+    chunks = _search_chunks(question, top_k=rag_config.top_k, use_case=use_case)
     context_texts = [c.text for c in chunks]
 
     # Step 2: build a tailored prompt based on role and use_case
-    role_note = ""
-    if role == "farmer":
-        role_note = (
-            "You are answering a question from a FARMER. Focus on very practical field-level "
-            "advice: clear symptoms, step-by-step controls, safe waiting periods, and cost-effective options."
-        )
-    elif role == "distributor":
-        role_note = (
-            "You are answering a question from a DISTRIBUTOR. Focus only on transport, storage, "
-            "spoilage reduction, temperature/moisture control, and packaging. Do not give farm-level crop advice."
-        )
+    full_prompt = _build_prompt(question, role, use_case)
 
-    uc_note = ""
-    if use_case:
-        uc_note = f"This question is categorized as: {use_case}. Prioritize answering that aspect."
+    # Step 3: call Gemini with or without context. We do not expose fallback behavior to the user.
+    try:
+        answer = generate_answer(full_prompt, context_texts, role=role)
+    except Exception as exc:
+        print("[RAG] Generation unavailable, serving a degraded answer:", exc)
+        return _degraded_answer(role, use_case, chunks, _embed_question(question))
+    if cache is not None and answer != FALLBACK_ANSWER:
+        cache.put(role, use_case, question, answer, embedding=_embed_question(question))
+    return answer
 
-    full_prompt = (
-        f"{role_note}\n\n{uc_note}\n\n"
-        "Answer in simple language that a non-technical farmer could understand. "
-        "Do not mention research papers, RAG, retrieval, or any internal systems."
-        f"\n\nQuestion: {question}"
-    )
 
-    # Step 3: call Gemini with or without context. We do not expose fallback behavior to the user.
-    answer = generate_answer(full_prompt, context_texts)
+async def _cached_answer_async(question: str, role: str, use_case: Optional[str]) -> Optional[str]:
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    cached = cache.get_exact(role, use_case, question)
+    if cached is None and cache.has_candidates(role, use_case):
+        cached = cache.get_similar(role, use_case, await _embed_question_async(question))
+    if cached is None:
+        cache.record_miss()
+    return cached
+
+
+async def answer_with_graph_rag_async(question: str, role: str, use_case: Optional[str] = None) -> str:
+    """Non-blocking variant of answer_with_graph_rag for async request handlers.
+
+    Same steps and caching, but embedding and generation use the async Gemini
+    client and the Chroma query runs on the dedicated Chroma executor, so the
+    event loop stays free while a request waits on the network.
+    """
+    cache = get_answer_cache()
+    cached = await _cached_answer_async(question, role, use_case)
+    if cached is not None:
+        return cached
+
+    chunks = await _search_chunks_async(question, top_k=rag_config.top_k, use_case=use_case)
+    context_texts = [c.text for c in chunks]
+    full_prompt = _build_prompt(question, role, use_case)
+
+    try:
+        answer = await generate_answer_async(full_prompt, context_texts, role=role)
+    except Exception as exc:
+        print("[RAG] Generation unavailable, serving a degraded answer:", exc)
+        return _degraded_answer(role, use_case, chunks, await _embed_question_async(question))
+    if cache is not None and answer != FALLBACK_ANSWER:
+        cache.put(role, use_case, question, answer, embedding=await _embed_question_async(question))
     return answer
+
+
+async def stream_answer_with_graph_rag(
+    question: str, role: str, use_case: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Streaming variant of answer_with_graph_rag_async.
+
+    Yields answer text fragments as Gemini generates them. A cached answer is
+    yielded as a single fragment; a fully streamed answer is cached at the end.
+    """
+    cached = await _cached_answer_async(question, role, use_case)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = await _search_chunks_async(question, top_k=rag_config.top_k, use_case=use_case)
+    context_texts = [c.text for c in chunks]
+    full_prompt = _build_prompt(question, role, use_case)
+
+    parts: List[str] = []
+    try:
+        async for text in generate_answer_stream(full_prompt, context_texts, role=role):
+            parts.append(text)
+            yield text
+    except Exception as exc:
+        if parts:
+            raise  # part of the answer is already on the wire
+        print("[RAG] Generation unavailable, serving a degraded answer:", exc)
+        yield _degraded_answer(role, use_case, chunks, await _embed_question_async(question))
+        return
+
+    answer = "".join(parts)
+    cache = get_answer_cache()
+    if cache is not None and answer != FALLBACK_ANSWER:
+        cache.put(role, use_case, question, answer, embedding=await _embed_question_async(question))
+
+
+def _group_near_duplicates(embeddings: List[List[float]], labels: List[str], threshold: float) -> List[int]:
+    """For each question, the index of the first question it is a near-duplicate of (itself if none).
+
+    Only questions with the same label (use_case, hence retrieval partition) are grouped.
+    """
+    group_of = list(range(len(embeddings)))
+    present = [i for i, e in enumerate(embeddings) if e]
+    if len(present) < 2:
+        return group_of
+    matrix = np.asarray([embeddings[i] for i in present], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    sims = matrix @ matrix.T
+    leaders: List[int] = []
+    for a, i in enumerate(present):
+        for b in leaders:
+            if labels[i] == labels[present[b]] and sims[a, b] >= threshold:
+                group_of[i] = present[b]
+                break
+        else:
+            leaders.append(a)
+    return group_of
+
+
+async def answer_batch_with_graph_rag(
+    items: List[Tuple[str, Optional[str]]], role: str
+) -> AsyncIterator[Tuple[int, str]]:
+    """Answer many (question, use_case) pairs at once, yielding (index, answer) as each completes.
+
+    - cached answers are yielded first;
+    - the remaining questions are embedded together (one batched call) and
+      near-duplicates (rag_config.batch_duplicate_similarity) are grouped;
+    - one vector query per retrieval partition covers every group, and each
+      group shares its retrieved context; identical questions also share the
+      generated answer;
+    - generation runs with at most rag_config.batch_generate_concurrency
+      answers in flight (and within the global generation limit).
+    """
+    cache = get_answer_cache()
+    pending: List[int] = []
+    for i, (question, use_case) in enumerate(items):
+        cached = cache.get_exact(role, use_case, question) if cache is not None else None
+        if cached is not None:
+            yield i, cached
+        else:
+            pending.append(i)
+    if not pending:
+        return
+
+    questions = [items[i][0] for i in pending]
+    k = rag_config.top_k
+    mode = rag_config.retrieval_mode
+    try:
+        embeddings = await embed_texts_async(questions) if mode != "lexical" else [[] for _ in questions]
+    except Exception as exc:
+        print("[RAG] Batch embedding failed, retrieving from the lexical index:", exc)
+        embeddings = [[] for _ in questions]
+
+    remaining: List[int] = []
+    for pos, i in enumerate(pending):
+        question, use_case = items[i]
+        cached = None
+        if cache is not None and embeddings[pos] and cache.has_candidates(role, use_case):
+            cached = cache.get_similar(role, use_case, embeddings[pos])
+        if cached is not None:
+            yield i, cached
+        else:
+            remaining.append(pos)
+            if cache is not None:
+                cache.record_miss()
+    if not remaining:
+        return
+
+    # Shared retrieval: one vector query per partition covering all its group leaders
+    group_of = _group_near_duplicates(
+        [embeddings[p] for p in remaining],
+        [items[pending[p]][1] or "" for p in remaining],
+        rag_config.batch_duplicate_similarity,
+    )
+    leaders = sorted(set(group_of))
+    increment("batch_questions", len(remaining))
+    increment("batch_retrieval_groups", len(leaders))
+    partitions: Dict[int, Optional[Partition]] = {}
+    by_partition: Dict[str, List[int]] = {}
+    for g in leaders:
+        question, use_case = items[pending[remaining[g]]]
+        partitions[g] = await run_in_chroma_executor(_route_partition, question, use_case)
+        if embeddings[remaining[g]]:
+            by_partition.setdefault(partitions[g].key if partitions[g] else "", []).append(g)
+    vector_hits: Dict[int, List[RagChunk]] = {}
+    for group in by_partition.values():
+        partition = partitions[group[0]]
+        results = await run_in_chroma_executor(
+            _query_collection, [embeddings[remaining[g]] for g in group], k, partition
+        )
+        vector_hits.update({g: _vector_ranked(results, n) for n, g in enumerate(group)})
+    context: Dict[int, List[RagChunk]] = {}
+    for g in leaders:
+        question = questions[remaining[g]]
+        local = await run_in_chroma_executor(_local_rankings, question, k, mode, partitions[g])
+        if g in vector_hits:
+            ranked = _fuse(vector_hits[g], *local)
+        else:
+            if mode == "vector":
+                local = [await run_in_chroma_executor(_lexical_ranked, question, k, partitions[g]), *local]
+            ranked = _fuse(*local)
+        context[g] = _select_chunks(ranked)
+        if not context[g] and partitions[g] is not None:
+            increment("partition_fallback")
+            context[g] = await _search_partition_async(question, k, None)
+
+    semaphore = asyncio.Semaphore(rag_config.batch_generate_concurrency)
+    answers: Dict[Tuple[str, str], "asyncio.Task[str]"] = {}
+
+    async def generate(pos: int, chunks: List[RagChunk]) -> str:
+        question, use_case = items[pending[pos]]
+        async with semaphore:
+            try:
+                answer = await generate_answer_async(
+                    _build_prompt(question, role, use_case), [c.text for c in chunks], role=role
+                )
+            except Exception as exc:
+                print("[RAG] Generation unavailable, serving a degraded answer:", exc)
+                return _degraded_answer(role, use_case, chunks, embeddings[pos])
+        if cache is not None and answer != FALLBACK_ANSWER:
+            cache.put(role, use_case, question, answer, embedding=embeddings[pos] or None)
+        return answer
+
+    async def answer_one(n: int, pos: int) -> Tuple[int, str]:
+        question, use_case = items[pending[pos]]
+        key = (use_case or "", normalize_question(question))
+        task = answers.get(key)
+        if task is None:
+            task = answers[key] = asyncio.ensure_future(generate(pos, context[group_of[n]]))
+        return pending[pos], await task
+
+    tasks = [asyncio.ensure_future(answer_one(n, pos)) for n, pos in enumerate(remaining)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in [*tasks, *answers.values()]:
+            task.cancel()
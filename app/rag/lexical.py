@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import rag_config
+
+if TYPE_CHECKING:  # pragma: no cover - import only for type hints
+    from .topics import Partition
+
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Small English stopword list; domain terms (crop, pest, chemical names) are what matter here.
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its my of on or "
+    "our should so than that the their them then there these they this to was we what when "
+    "which who why will with you your".split()
+)
+
+# (chunk_id, text, metadata, score)
+LexicalHit = Tuple[str, str, Dict[str, Any], float]
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index stored in SQLite.
+
+    Built at ingest time from the same chunks that go into Chroma and updated
+    incrementally (upsert/delete per chunk), so it can answer retrieval with
+    no network calls at all.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75) -> None:
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            """
+        )
+        self._conn.commit()
+
+    def _delete_locked(self, ids: Sequence[str]) -> None:
+        rows = [(cid,) for cid in ids]
+        self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", rows)
+
+    def upsert(self, docs: Sequence[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """Add or replace (chunk_id, text, metadata) documents."""
+        if not docs:
+            return
+        with self._lock:
+            self._delete_locked([cid for cid, _, _ in docs])
+            for cid, text, metadata in docs:
+                counts = Counter(tokenize(text))
+                self._conn.execute(
+                    "INSERT INTO docs (chunk_id, length, text, metadata) VALUES (?, ?, ?, ?)",
+                    (cid, sum(counts.values()), text, json.dumps(metadata or {})),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, cid, tf) for term, tf in counts.items()],
+                )
+            self._conn.commit()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+
+    def update_metadata(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Merge metadata keys into indexed documents (unknown chunk IDs are ignored)."""
+        if not updates:
+            return
+        with self._lock:
+            found = self._get_locked(list(updates))
+            self._conn.executemany(
+                "UPDATE docs SET metadata = ? WHERE chunk_id = ?",
+                [(json.dumps({**metadata, **updates[cid]}), cid) for cid, (_, metadata) in found.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _get_locked(self, ids: Sequence[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        found: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            part = list(ids[start : start + 500])
+            placeholders = ",".join("?" for _ in part)
+            rows = self._conn.execute(
+                f"SELECT chunk_id, text, metadata FROM docs WHERE chunk_id IN ({placeholders})", part
+            )
+            for cid, text, metadata in rows:
+                found[cid] = (text, json.loads(metadata))
+        return found
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """(text, metadata) for the given chunk IDs that are in the index."""
+        with self._lock:
+            return self._get_locked(ids)
+
+    def count(self, partition: Optional["Partition"] = None) -> int:
+        """Number of indexed chunks, optionally only those in a topic/crop partition."""
+        where, params = partition.sql_where() if partition is not None else ("1", [])
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM docs WHERE {where}", params).fetchone()[0]
+
+    def search(self, query: str, k: int, partition: Optional["Partition"] = None) -> List[LexicalHit]:
+        """Return the top-k chunks by BM25 score (best first), optionally within a partition.
+
+        Only postings of chunks in the partition are scored; term statistics
+        (document frequency, average length) stay corpus-wide.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, avg_len = self._conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            avg_len = avg_len or 1.0
+            where, params = partition.sql_where() if partition is not None else ("1", [])
+
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id "
+                    f"WHERE p.term = ? AND {where}",
+                    (term, *params),
+                ).fetchall()
+                if not postings:
+                    continue
+                if partition is None:
+                    df = len(postings)
+                else:
+                    df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for cid, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_len)
+                    scores[cid] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            docs = self._get_locked([cid for cid, _ in ranked])
+            return [(cid, *docs[cid], score) for cid, score in ranked if cid in docs]
+
+
+@lru_cache(maxsize=1)
+def get_lexical_index() -> BM25Index:
+    return BM25Index(rag_config.lexical_index_path)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda cid: scores[cid], reverse=True)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+
+# Keep the most recent samples per stage so long-running servers stay bounded in memory.
+_MAX_SAMPLES = 10_000
+
+_lock = threading.Lock()
+_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_MAX_SAMPLES))
+_counters: Dict[str, int] = defaultdict(int)
+
+
+def observe(stage: str, seconds: float) -> None:
+    with _lock:
+        _samples[stage].append(seconds)
+
+
+def increment(counter: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[counter] += amount
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the wall-clock duration of the block under `stage` (also on error)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def stage_summary(stage: str) -> Dict[str, float]:
+    """count, p50, p95, p99 and max (seconds) for one stage."""
+    with _lock:
+        values = sorted(_samples.get(stage, ()))
+    return {
+        "count": float(len(values)),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Summaries for every stage plus a "counters" entry."""
+    with _lock:
+        stages = list(_samples)
+        counters = dict(_counters)
+    summary: Dict[str, Dict[str, float]] = {stage: stage_summary(stage) for stage in stages}
+    summary["counters"] = {k: float(v) for k, v in counters.items()}
+    return summary
+
+
+def reset() -> None:
+    with _lock:
+        _samples.clear()
+        _counters.clear()
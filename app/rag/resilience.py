@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from .config import rag_config
+from .metrics import increment, observe, stage_summary
+
+
+T = TypeVar("T")
+
+
+class ProviderUnavailable(Exception):
+    """The model provider was not called or did not answer in time."""
+
+
+class CircuitOpenError(ProviderUnavailable):
+    pass
+
+
+class CallTimeout(ProviderUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker for one provider stage.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    calls fail immediately with CircuitOpenError. After `reset_seconds` a
+    single probe call is let through (half-open); its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return self._state
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == "closed":
+                return
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = "half_open"
+                self._probing = False
+            if self._state == "half_open" and not self._probing:
+                self._probing = True
+                return
+        increment(f"breaker_{self.name}_rejected")
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                print(f"[RAG] {self.name} circuit closed")
+            self._state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """End a half-open probe without a verdict (e.g. a quota error the caller retries)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    print(f"[RAG] {self.name} circuit opened after {self._failures} failure(s)")
+                    increment(f"breaker_{self.name}_opened")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(stage: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(stage)
+        if breaker is None:
+            breaker = _BREAKERS[stage] = CircuitBreaker(
+                stage, rag_config.breaker_failure_threshold, rag_config.breaker_reset_seconds
+            )
+        return breaker
+
+
+def breaker_states() -> Dict[str, str]:
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return {b.name: b.state for b in breakers}
+
+
+def hedge_delay(stage: str) -> Optional[float]:
+    """Seconds to wait before sending a duplicate request: the recent p95 call latency.
+
+    None while hedging is disabled for the stage or too few calls have been seen.
+    """
+    if stage not in rag_config.hedge_stages:
+        return None
+    summary = stage_summary(f"{stage}_call")
+    if summary["count"] < rag_config.hedge_min_samples:
+        return None
+    return max(rag_config.hedge_min_delay, summary["p95"])
+
+
+@lru_cache(maxsize=1)
+def _hedge_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=rag_config.hedge_pool_workers, thread_name_prefix="rag-hedge")
+
+
+def _run_hedged(stage: str, fn: Callable[[], T], timeout: float) -> T:
+    delay = hedge_delay(stage)
+    if delay is None or delay >= timeout:
+        return fn()  # the SDK call itself carries the deadline
+    deadline = time.monotonic() + timeout
+    primary = _hedge_pool().submit(fn)
+    futures: List[Future] = [primary]
+    if not wait(futures, timeout=delay).done:
+        increment(f"{stage}_hedges")
+        futures.append(_hedge_pool().submit(fn))
+    error: Optional[BaseException] = None
+    while futures:
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise CallTimeout(f"{stage} call exceeded {timeout:.1f}s")
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                if future is not primary:
+                    increment(f"{stage}_hedge_wins")
+                for other in futures:
+                    other.cancel()  # best effort; a running duplicate finishes in the background
+                return future.result()
+            error = future.exception()
+    raise error  # type: ignore[misc]
+
+
+async def _run_hedged_async(stage: str, fn: Callable[[], Awaitable[T]], timeout: float) -> T:
+    delay = hedge_delay(stage)
+    primary = asyncio.ensure_future(fn())
+    tasks = [primary]
+    deadline = time.monotonic() + timeout
+    try:
+        if delay is not None and delay < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                increment(f"{stage}_hedges")
+                tasks.append(asyncio.ensure_future(fn()))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise CallTimeout(f"{stage} call exceeded {timeout:.1f}s")
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    if task is not primary:
+                        increment(f"{stage}_hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error  # type: ignore[misc]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def call_with_resilience(
+    stage: str,
+    fn: Callable[[], T],
+    timeout: float,
+    ignore: Tuple[Type[BaseException], ...] = (),
+) -> T:
+    """Run one provider call behind the stage's circuit breaker, with hedging.
+
+    `fn` must apply `timeout` itself (SDK request options); hedged calls are
+    additionally bounded here. Exceptions in `ignore` (e.g. quota errors that
+    the caller retries) do not count as breaker failures.
+    """
+    breaker = get_breaker(stage)
+    breaker.before_call()
+    start = time.perf_counter()
+    try:
+        result = _run_hedged(stage, fn, timeout)
+    except Exception as exc:
+        _record_failure(stage, breaker, exc, ignore)
+        raise
+    except BaseException:
+        # Cancelled or interrupted (client disconnect, shutdown): free a half-open probe, no verdict
+        breaker.release()
+        raise
+    breaker.record_success()
+    observe(f"{stage}_call", time.perf_counter() - start)
+    return result
+
+
+async def call_with_resilience_async(
+    stage: str,
+    fn: Callable[[], Awaitable[T]],
+    timeout: float,
+    ignore: Tuple[Type[BaseException], ...] = (),
+) -> T:
+    """Async call_with_resilience; the deadline is enforced here for every attempt."""
+    breaker = get_breaker(stage)
+    breaker.before_call()
+    start = time.perf_counter()
+    try:
+        result = await _run_hedged_async(stage, fn, timeout)
+    except Exception as exc:
+        _record_failure(stage, breaker, exc, ignore)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record_success()
+    observe(f"{stage}_call", time.perf_counter() - start)
+    return result
+
+
+async def stream_with_resilience_async(
+    stage: str,
+    fn: Callable[[], Awaitable[Any]],
+    timeout: float,
+    ignore: Tuple[Type[BaseException], ...] = (),
+) -> AsyncIterator[Any]:
+    """Open a streaming call and yield its items; opening and every item share one `timeout` deadline.
+
+    The breaker records success only once the stream is exhausted: a stall or
+    an error mid-stream counts as a failure, and a consumer that stops early
+    just releases the call.
+    """
+    breaker = get_breaker(stage)
+    breaker.before_call()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = loop.time() + timeout
+    try:
+        items = (await _run_hedged_async(stage, fn, timeout)).__aiter__()
+        while True:
+            try:
+                item = await asyncio.wait_for(items.__anext__(), max(0.0, deadline - loop.time()))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise CallTimeout(f"{stage} stream exceeded {timeout:.1f}s") from None
+            yield item
+    except Exception as exc:
+        _record_failure(stage, breaker, exc, ignore)
+        raise
+    except BaseException:  # GeneratorExit from a consumer that stopped early, or cancellation
+        breaker.release()
+        raise
+    breaker.record_success()
+    observe(f"{stage}_call", time.perf_counter() - start)
+
+
+def _record_failure(
+    stage: str, breaker: CircuitBreaker, exc: BaseException, ignore: Tuple[Type[BaseException], ...]
+) -> None:
+    if isinstance(exc, (CallTimeout, google_exceptions.DeadlineExceeded)):
+        increment(f"{stage}_timeouts")
+    if ignore and isinstance(exc, ignore):
+        breaker.release()
+        return
+    increment(f"{stage}_failures")
+    breaker.record_failure()
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .concepts import CONCEPT_LEXICON, extract_concepts
+from .config import rag_config
+
+
+# Bump when the rules below change so ingestion re-tags every file.
+TAGGER_VERSION = 1
+
+# Topic labels match FarmerQuestion.use_case / DistributorQuestion.use_case.
+# Keyword phrases are matched on lowercase word n-grams (up to 3 words).
+TOPIC_KEYWORDS: Dict[str, List[str]] = {
+    "disease_diagnosis": [
+        "disease", "diseases", "symptom", "symptoms", "infection", "infected", "fungal", "fungus",
+        "bacterial", "viral", "virus", "lesion", "lesions", "pathogen", "wilt", "blight", "rot",
+        "mildew", "leaf spot", "fungicide",
+    ],
+    "pest_control": [
+        "pest", "pests", "insect", "insects", "larva", "larvae", "infestation", "insecticide",
+        "pesticide", "trap", "traps", "ipm", "integrated pest management", "biocontrol", "predator",
+        "parasitoid", "spray",
+    ],
+    "fertilizer_guidance": [
+        "fertilizer", "fertiliser", "fertilizers", "urea", "dap", "npk", "nitrogen", "phosphorus",
+        "potassium", "micronutrient", "micronutrients", "nutrient", "nutrients", "kg ha", "top dressing",
+        "basal dose", "foliar",
+    ],
+    "weather_risk": [
+        "rainfall", "rain", "drought", "frost", "heat", "heatwave", "flood", "flooding", "monsoon",
+        "weather", "climate", "hailstorm", "cyclone", "dry spell",
+    ],
+    "storage": [
+        "storage", "stored", "warehouse", "godown", "silo", "shelf life", "moisture content",
+        "cold storage", "storage pest", "hermetic",
+    ],
+    "yield_improvement": [
+        "yield", "yields", "productivity", "spacing", "variety", "varieties", "sowing", "planting",
+        "plant density", "irrigation", "harvest index", "hybrid", "seed rate",
+    ],
+    "organic_vs_chemical": [
+        "organic", "biopesticide", "biopesticides", "neem", "compost", "vermicompost", "residue",
+        "residues", "biofertilizer", "natural farming", "chemical", "chemicals", "synthetic",
+    ],
+    "soil_health": [
+        "soil", "soils", "organic carbon", "ph", "salinity", "erosion", "soil test", "microbial",
+        "tillage", "soil health", "organic matter",
+    ],
+    "best_transport": [
+        "transport", "transportation", "truck", "trucks", "vehicle", "logistics", "loading",
+        "unloading", "refrigerated", "reefer", "road", "distance", "transit",
+    ],
+    "spoilage_reduction": [
+        "spoilage", "post harvest", "postharvest", "losses", "loss", "decay", "rotting", "packaging",
+        "precooling", "pre cooling", "ethylene", "ripening", "bruising", "shelf life", "cold chain",
+    ],
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=1)
+def _phrase_topics() -> Dict[str, List[str]]:
+    phrases: Dict[str, List[str]] = {}
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        for keyword in keywords:
+            phrases.setdefault(" ".join(_WORD_RE.findall(keyword)), []).append(topic)
+    return phrases
+
+
+def classify_topics(text: str) -> List[str]:
+    """Topics whose keywords occur often enough in text (keyword rules, no model)."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return []
+    phrases = _phrase_topics()
+    hits: Counter = Counter()
+    for i in range(len(words)):
+        for n in (3, 2, 1):
+            topics = phrases.get(" ".join(words[i : i + n]))
+            if topics:
+                hits.update(topics)
+                break
+    # At least `topic_min_hits` mentions, scaled up for long chunks (about one per 150 words).
+    needed = max(rag_config.topic_min_hits, len(words) // 150)
+    return sorted(topic for topic, count in hits.items() if count >= needed)
+
+
+def extract_crops(text: str) -> List[str]:
+    return sorted(c for c in extract_concepts(text) if CONCEPT_LEXICON[c][0] == "crop")
+
+
+def _crop_key(crop: str) -> str:
+    return "crop_" + crop.replace(" ", "_")
+
+
+def topic_metadata(text: str) -> Dict[str, Any]:
+    """Chunk metadata tags: a boolean key per topic/crop (filterable in Chroma) plus readable lists."""
+    topics = classify_topics(text)
+    crops = extract_crops(text)
+    metadata: Dict[str, Any] = {f"topic_{t}": True for t in topics}
+    metadata.update({_crop_key(c): True for c in crops})
+    metadata["topics"] = ",".join(topics)
+    metadata["crops"] = ",".join(crops)
+    return metadata
+
+
+@dataclass(frozen=True)
+class Partition:
+    """A slice of the corpus: chunks tagged with `topic` and, if given, any of `crops`."""
+
+    topic: Optional[str] = None
+    crops: Tuple[str, ...] = ()
+
+    @property
+    def key(self) -> str:
+        return f"{self.topic or '*'}|{','.join(self.crops) or '*'}"
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        if self.topic and not metadata.get(f"topic_{self.topic}"):
+            return False
+        return not self.crops or any(metadata.get(_crop_key(c)) for c in self.crops)
+
+    def chroma_where(self) -> Optional[Dict[str, Any]]:
+        clauses: List[Dict[str, Any]] = []
+        if self.topic:
+            clauses.append({f"topic_{self.topic}": True})
+        if len(self.crops) == 1:
+            clauses.append({_crop_key(self.crops[0]): True})
+        elif self.crops:
+            clauses.append({"$or": [{_crop_key(c): True} for c in self.crops]})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def sql_where(self) -> Tuple[str, List[Any]]:
+        """Condition on a JSON `metadata` column (SQLite json_extract)."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if self.topic:
+            clauses.append("json_extract(metadata, ?) = 1")
+            params.append(f"$.topic_{self.topic}")
+        if self.crops:
+            clauses.append("(" + " OR ".join("json_extract(metadata, ?) = 1" for _ in self.crops) + ")")
+            params.extend(f"$.{_crop_key(c)}" for c in self.crops)
+        return " AND ".join(clauses) or "1", params
+
+
+def candidate_partitions(query: str, use_case: Optional[str]) -> Sequence[Partition]:
+    """Partitions to try for a query, narrowest first (the full index is implied last)."""
+    if not rag_config.partition_routing or use_case not in TOPIC_KEYWORDS:
+        return []
+    crops = tuple(extract_crops(query)) if rag_config.partition_by_crop else ()
+    if crops:
+        return [Partition(use_case, crops), Partition(use_case)]
+    return [Partition(use_case)]
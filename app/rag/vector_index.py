@@ -0,0 +1,449 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .answer_cache import corpus_version
+from .config import rag_config
+
+if TYPE_CHECKING:  # pragma: no cover - import only for type hints
+    from .topics import Partition
+
+
+# (chunk_id, text, metadata, squared L2 distance between unit vectors = 2 - 2*cos)
+VectorHit = Tuple[str, str, Dict[str, Any], float]
+
+_MIN_CAPACITY = 1024
+_COMPACT_DEAD_FRACTION = 0.25
+# Quantized rows are upcast to float32 this many at a time during a scan
+_SCAN_BLOCK_ROWS = 4096
+
+Codec = Dict[str, Any]  # {"reduction": "none"|"pca"|"truncate", "dim": int, "quantization": "float32"|"int8"}
+
+
+def _unit_rows(vectors: Any) -> np.ndarray:
+    arr = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+def configured_codec(full_dim: int) -> Codec:
+    """Storage transform requested by RagConfig for vectors of full_dim dimensions."""
+    reduction = rag_config.vector_reduction
+    dim = min(rag_config.vector_reduced_dim, full_dim) if reduction != "none" else full_dim
+    return {"reduction": reduction, "dim": dim, "quantization": rag_config.vector_quantization}
+
+
+def _is_plain(codec: Codec) -> bool:
+    return codec["reduction"] == "none" and codec["quantization"] == "float32"
+
+
+def fit_projection(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """Top-`dim` principal directions of the (uncentered) corpus, as a (full_dim, dim) matrix.
+
+    Uncentered so that dot products, and therefore cosine rankings, are
+    approximated directly: x.q ~= (x P).(q P).
+    """
+    gram = vectors.T.astype(np.float64) @ vectors.astype(np.float64)
+    _, eigvecs = np.linalg.eigh(gram)  # ascending eigenvalues
+    return np.ascontiguousarray(eigvecs[:, ::-1][:, :dim], dtype=np.float32)
+
+
+def reduce_vectors(vectors: np.ndarray, codec: Codec, projection: Optional[np.ndarray]) -> np.ndarray:
+    if codec["reduction"] == "pca":
+        return vectors @ projection
+    if codec["reduction"] == "truncate":
+        # Matryoshka-style: keep the leading dimensions and renormalize
+        return _unit_rows(vectors[:, : codec["dim"]])
+    return vectors
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization: v ~= codes * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class NumpyVectorIndex:
+    """Exact vector search over a memory-mapped float32 matrix.
+
+    Unit-normalized embeddings live row by row in a preallocated `.npy` file
+    that is opened with mmap. Chunk ID, text and metadata per row are kept in
+    a SQLite table. Queries are a single matrix multiply against every live
+    row, so a batch of questions costs one BLAS call.
+
+    Optionally (RagConfig.vector_reduction / vector_quantization) the matrix
+    that is scanned holds reduced (PCA or Matryoshka truncation) and/or int8
+    vectors with per-vector scales. The full-precision matrix stays on disk
+    and only the best rag_config.vector_rescore_candidates rows per query are
+    read back from it for exact rescoring.
+
+    Rows are append-only. Deleting or replacing a chunk leaves a dead row,
+    and the matrices are rewritten as a new generation (compacted, and with
+    the PCA projection refitted) once a quarter of the rows are dead, when
+    they run out of capacity, or when the configured codec changes. The
+    active generation is stored in SQLite, so a crash mid-way never pairs
+    rows with the wrong vectors, and readers reload when the corpus version
+    stamp changes.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / "rows.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
+        self._loaded_version: Optional[float] = None
+        self._matrix: Optional[np.ndarray] = None  # full precision, used for rescoring
+        self._codes: Optional[np.ndarray] = None  # what is scanned (None = scan _matrix)
+        self._scales: Optional[np.ndarray] = None
+        self._projection: Optional[np.ndarray] = None
+        self._codec: Optional[Codec] = None
+        self._rows: Dict[str, int] = {}
+        self._docs: List[Optional[Tuple[str, str, Dict[str, Any]]]] = []
+        self._dead = np.zeros(0, dtype=bool)
+        self._partition_masks: Dict[str, np.ndarray] = {}
+
+    # --- storage ---------------------------------------------------------
+
+    def _meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta"))
+
+    def _set_meta(self, **values: Any) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(k, str(v)) for k, v in values.items()]
+        )
+
+    @staticmethod
+    def _codec_of(meta: Dict[str, str]) -> Codec:
+        if "codec" in meta:
+            return json.loads(meta["codec"])
+        return {"reduction": "none", "dim": int(meta["dim"]), "quantization": "float32"}
+
+    def _load(self, name: str, mode: str = "r") -> np.ndarray:
+        return np.load(self.directory / name, mmap_mode=mode)
+
+    def _open(self, meta: Dict[str, str], mode: str = "r") -> Optional[np.ndarray]:
+        name = meta.get("file")
+        if not name:
+            return None
+        return self._load(name, mode)
+
+    def _allocate(self, name: str, dtype: Any, shape: Tuple[int, ...], head: np.ndarray) -> None:
+        out = np.lib.format.open_memmap(self.directory / name, mode="w+", dtype=dtype, shape=shape)
+        out[: len(head)] = head
+        out.flush()
+        del out
+
+    def _remove_stale_files(self, generation: int) -> None:
+        for path in self.directory.glob("*.npy"):
+            if not path.stem.endswith(f"-{generation}"):
+                path.unlink(missing_ok=True)
+
+    def _encode(self, meta: Dict[str, str], vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        codec = self._codec_of(meta)
+        projection = self._load(meta["projection"]) if codec["reduction"] == "pca" else None
+        reduced = reduce_vectors(vectors, codec, projection)
+        if codec["quantization"] == "int8":
+            return quantize(reduced)
+        return reduced.astype(np.float32), np.ones(len(reduced), dtype=np.float32)
+
+    def _compact_locked(self, meta: Dict[str, str], extra: np.ndarray) -> Dict[str, str]:
+        """Rewrite live rows densely as a new generation with room for `extra` more rows.
+
+        The configured codec is applied, and a PCA projection is fitted on
+        the live rows plus `extra`.
+        """
+        live = self._conn.execute("SELECT row FROM rows ORDER BY row").fetchall()
+        old = self._open(meta)
+        dim = int(meta["dim"])
+        rows = np.asarray(old[[r for (r,) in live]] if old is not None and live else np.empty((0, dim)), np.float32)
+        capacity = max(_MIN_CAPACITY, 2 * (len(rows) + len(extra)))
+        generation = int(meta.get("generation", "0")) + 1
+        codec = configured_codec(dim)
+
+        name = f"vectors-{generation}.npy"
+        self._allocate(name, np.float32, (capacity, dim), rows)
+        new_meta: Dict[str, Any] = {
+            "file": name,
+            "generation": generation,
+            "capacity": capacity,
+            "next_row": len(rows),
+            "codec": json.dumps(codec),
+        }
+        if not _is_plain(codec):
+            if codec["reduction"] == "pca":
+                new_meta["projection"] = f"projection-{generation}.npy"
+                np.save(self.directory / new_meta["projection"], fit_projection(np.vstack([rows, extra]), codec["dim"]))
+            codes, scales = self._encode({**meta, **{k: str(v) for k, v in new_meta.items()}}, rows)
+            new_meta["codes"] = f"codes-{generation}.npy"
+            new_meta["scales"] = f"scales-{generation}.npy"
+            code_dtype = np.int8 if codec["quantization"] == "int8" else np.float32
+            self._allocate(new_meta["codes"], code_dtype, (capacity, codec["dim"]), codes)
+            self._allocate(new_meta["scales"], np.float32, (capacity,), scales)
+
+        self._conn.execute("UPDATE rows SET row = -row - 1")  # avoid PK clashes while renumbering
+        self._conn.executemany(
+            "UPDATE rows SET row = ? WHERE row = ?", [(new, -old_row - 1) for new, (old_row,) in enumerate(live)]
+        )
+        self._conn.executemany("DELETE FROM meta WHERE key = ?", [("projection",), ("codes",), ("scales",)])
+        self._set_meta(**new_meta)
+        self._conn.commit()
+        self._remove_stale_files(generation)
+        return self._meta()
+
+    def upsert(self, items: Sequence[Tuple[str, str, Dict[str, Any], Sequence[float]]]) -> None:
+        """Add or replace (chunk_id, text, metadata, embedding) rows."""
+        if not items:
+            return
+        vectors = _unit_rows([vec for _, _, _, vec in items])
+        with self._lock:
+            meta = self._meta()
+            dim = int(meta.get("dim", vectors.shape[1]))
+            if vectors.shape[1] != dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match the index ({dim}); "
+                    f"remove {self.directory} and re-ingest after changing the embedding model."
+                )
+            if "dim" not in meta:
+                self._set_meta(dim=dim, generation=0, capacity=0, next_row=0)
+                meta = self._meta()
+
+            self._conn.executemany("DELETE FROM rows WHERE chunk_id = ?", [(cid,) for cid, _, _, _ in items])
+            next_row, capacity = int(meta["next_row"]), int(meta["capacity"])
+            if next_row + len(items) > capacity or self._codec_of(meta) != configured_codec(dim):
+                meta = self._compact_locked(meta, extra=vectors)
+                next_row = int(meta["next_row"])
+
+            end = next_row + len(items)
+            matrix = self._open(meta, mode="r+")
+            matrix[next_row:end] = vectors
+            matrix.flush()
+            del matrix
+            if "codes" in meta:
+                codes, scales = self._encode(meta, vectors)
+                for name, values in ((meta["codes"], codes), (meta["scales"], scales)):
+                    out = self._load(name, mode="r+")
+                    out[next_row:end] = values
+                    out.flush()
+                    del out
+            self._conn.executemany(
+                "INSERT INTO rows (row, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (next_row + i, cid, text, json.dumps(metadata or {}))
+                    for i, (cid, text, metadata, _) in enumerate(items)
+                ],
+            )
+            self._set_meta(next_row=end)
+            self._conn.commit()
+            self._loaded_version = None
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM rows WHERE chunk_id = ?", [(cid,) for cid in ids])
+            self._conn.commit()
+            meta = self._meta()
+            used = int(meta.get("next_row", "0"))
+            live = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            if used and (used - live) / used > _COMPACT_DEAD_FRACTION:
+                self._compact_locked(meta, extra=np.empty((0, int(meta["dim"])), np.float32))
+            self._loaded_version = None
+
+    def update_metadata(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Merge metadata keys into indexed rows (unknown chunk IDs are ignored); vectors are untouched."""
+        if not updates:
+            return
+        with self._lock:
+            ids = list(updates)
+            changed = []
+            for start in range(0, len(ids), 500):
+                part = ids[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, metadata FROM rows WHERE chunk_id IN ({','.join('?' * len(part))})", part
+                )
+                changed.extend((json.dumps({**json.loads(metadata), **updates[cid]}), cid) for cid, metadata in rows)
+            self._conn.executemany("UPDATE rows SET metadata = ? WHERE chunk_id = ?", changed)
+            self._conn.commit()
+            self._loaded_version = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def footprint(self) -> Dict[str, Any]:
+        """Bytes the index stores on disk (per file) and keeps resident while scanning.
+
+        With a reduced/quantized codec a scan touches only the codes, scales
+        and projection; the full-precision matrix is a memmap read back for
+        the rescored candidates only, so it counts on disk but not as resident.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            meta = self._meta()
+            files = {"vectors": "file", "codes": "codes", "scales": "scales", "projection": "projection"}
+            disk = {part: (self.directory / meta[key]).stat().st_size for part, key in files.items() if key in meta}
+            disk["rows"] = sum(p.stat().st_size for p in self.directory.glob("rows.sqlite3*"))
+            full = self._matrix.nbytes if self._matrix is not None else 0
+            if self._codes is None:
+                resident = full
+                scanned = self._matrix.shape[1] * 4 if self._matrix is not None else 0
+            else:
+                resident = self._codes.nbytes + self._scales.nbytes
+                resident += self._projection.nbytes if self._projection is not None else 0
+                scanned = self._codes.shape[1] * self._codes.dtype.itemsize + 4
+            return {
+                "rows": len(self._rows),
+                "codec": self._codec,
+                "disk_bytes": disk,
+                "total_disk_bytes": sum(disk.values()),
+                "resident_bytes": resident,
+                "full_resident_bytes": full,  # what a float32 scan of the same rows keeps resident
+                "scan_bytes_per_row": scanned,
+                "reduction_factor": full / resident if resident else 1.0,
+            }
+
+    # --- query side ------------------------------------------------------
+
+    def _ensure_loaded(self) -> None:
+        version = corpus_version()
+        if self._loaded_version == version:
+            return
+        meta = self._meta()
+        used = int(meta.get("next_row", "0"))
+        docs: List[Optional[Tuple[str, str, Dict[str, Any]]]] = [None] * used
+        rows: Dict[str, int] = {}
+        for row, cid, text, metadata in self._conn.execute("SELECT row, chunk_id, text, metadata FROM rows"):
+            docs[row] = (cid, text, json.loads(metadata))
+            rows[cid] = row
+        matrix = self._open(meta)
+        self._matrix = matrix[:used] if matrix is not None else None
+        self._codec = self._codec_of(meta) if "dim" in meta else None
+        self._codes = self._load(meta["codes"])[:used] if "codes" in meta else None
+        self._scales = self._load(meta["scales"])[:used] if "scales" in meta else None
+        self._projection = np.asarray(self._load(meta["projection"])) if "projection" in meta else None
+        self._docs = docs
+        self._rows = rows
+        self._dead = np.array([d is None for d in docs], dtype=bool)
+        self._partition_masks = {}
+        self._loaded_version = version
+
+    def _top(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Row indices of the k best scores, best first."""
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _approx_scores(self, reduced: np.ndarray) -> np.ndarray:
+        """Scores of every row against the reduced queries, from the compact codes.
+
+        Codes are upcast one block of rows at a time, so a scan never holds a
+        full-precision copy of the code matrix.
+        """
+        codes, scales = self._codes, self._scales
+        approx = np.empty((reduced.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], _SCAN_BLOCK_ROWS):
+            stop = start + _SCAN_BLOCK_ROWS
+            block = codes[start:stop].astype(np.float32)
+            approx[:, start:stop] = (reduced @ block.T) * scales[start:stop]
+        return approx
+
+    def _excluded(self, partition: Optional["Partition"]) -> Tuple[np.ndarray, int]:
+        """Mask of rows outside the partition (dead rows included) and the number of rows left."""
+        if partition is None:
+            return self._dead, len(self._rows)
+        mask = self._partition_masks.get(partition.key)
+        if mask is None:
+            mask = np.array([d is None or not partition.matches(d[2]) for d in self._docs], dtype=bool)
+            self._partition_masks[partition.key] = mask
+        return mask, int((~mask).sum())
+
+    def search(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        k: int,
+        exact: bool = False,
+        partition: Optional["Partition"] = None,
+    ) -> List[List[VectorHit]]:
+        """Top-k per query (best first) using one matrix multiply for the whole batch.
+
+        With a reduced/quantized codec the scan is approximate and the best
+        rag_config.vector_rescore_candidates rows are rescored exactly;
+        exact=True scans the full-precision matrix instead (recall baselines).
+        `partition` restricts the search to chunks tagged with its topic/crops.
+        """
+        queries = _unit_rows(query_embeddings)
+        with self._lock:
+            self._ensure_loaded()
+            if self._matrix is None or not self._rows:
+                return [[] for _ in range(len(queries))]
+            if queries.shape[1] != self._matrix.shape[1]:
+                raise ValueError(f"Query dimension {queries.shape[1]} does not match the index")
+            excluded, available = self._excluded(partition)
+            if not available:
+                return [[] for _ in range(len(queries))]
+            k = min(k, available)
+
+            if exact or self._codes is None:
+                scores = queries @ self._matrix.T
+                scores[:, excluded] = -np.inf
+                shortlist = [self._top(row_scores, k) for row_scores in scores]
+            else:
+                reduced = reduce_vectors(queries, self._codec, self._projection)
+                approx = self._approx_scores(reduced)
+                approx[:, excluded] = -np.inf
+                n_candidates = min(max(k, rag_config.vector_rescore_candidates), available)
+                scores = np.full(approx.shape, -np.inf, dtype=np.float32)
+                shortlist = []
+                for qi, row_scores in enumerate(approx):
+                    candidates = self._top(row_scores, n_candidates)
+                    # rescoring reads only these rows of the full-precision matrix from disk
+                    scores[qi, candidates] = np.asarray(self._matrix[candidates]) @ queries[qi]
+                    shortlist.append(candidates[np.argsort(-scores[qi, candidates])][:k])
+
+            results: List[List[VectorHit]] = []
+            for qi, ordered in enumerate(shortlist):
+                hits: List[VectorHit] = []
+                for row in ordered:
+                    cid, text, metadata = self._docs[row]
+                    hits.append((cid, text, metadata, float(2.0 - 2.0 * scores[qi, row])))
+                results.append(hits)
+            return results
+
+    def query(
+        self, query_embeddings: Sequence[Sequence[float]], k: int, partition: Optional["Partition"] = None
+    ) -> Dict[str, Any]:
+        """Same shape as chromadb's Collection.query, so callers can swap engines."""
+        hits = self.search(query_embeddings, k, partition=partition)
+        return {
+            "ids": [[h[0] for h in q] for q in hits],
+            "documents": [[h[1] for h in q] for q in hits],
+            "metadatas": [[h[2] for h in q] for q in hits],
+            "distances": [[h[3] for h in q] for q in hits],
+        }
+
+
+@lru_cache(maxsize=1)
+def get_numpy_index() -> NumpyVectorIndex:
+    return NumpyVectorIndex(rag_config.numpy_index_dir)
@@ -6,7 +6,8 @@ from sqlalchemy.orm import Session
 from ..models.batch import Batch, BatchCreate, BatchStatus
 from ..database import get_db
 from ..db_models import BatchDB
-from app.blockchain import bc_record_batch_created
+from app.blockchain import batch_created_event
+from app.chain_outbox import enqueue_chain_event
 
 
 def _to_batch_schema(db_batch: BatchDB) -> Batch:
@@ -69,20 +70,21 @@ def create_farmer_batch(db: Session, farmer_id: int, location: str, batch_in: Ba
         updated_at=datetime.utcnow(),
     )
     db.add(db_batch)
-    db.commit()
-    db.refresh(db_batch)
 
-    # Blockchain: farmer created a new batch (core traceability event)
-    try:  # fail-soft so main flow keeps working even if chain write fails
-        bc_record_batch_created(
+    # Blockchain: farmer created a new batch (core traceability event), committed with the batch
+    # and sent by the outbox worker
+    enqueue_chain_event(
+        db,
+        batch_created_event(
             batch_id=db_batch.batch_code,
             crop_name=db_batch.crop_name,
             quantity_kg=float(db_batch.quantity or 0),
             harvest_dt=db_batch.harvest_date,
             image_url=db_batch.image_url,
-        )
-    except Exception as exc:  # pragma: no cover - integration side effects
-        print("[BC] Failed to record batch creation:", exc)
+        ),
+    )
+    db.commit()
+    db.refresh(db_batch)
 
     return _to_batch_schema(db_batch)
 
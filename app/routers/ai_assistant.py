@@ -1,13 +1,24 @@
 from __future__ import annotations
 
-from typing import Literal, Optional
+import json
+from typing import AsyncIterator, Dict, List, Literal, Optional
 
 from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from ..models.user import User, UserRole
 from ..security import get_current_user
-from ..rag.graph_rag import answer_with_graph_rag
+from ..rag.config import rag_config
+from ..rag.graph_rag import (
+    answer_batch_with_graph_rag,
+    answer_with_graph_rag_async,
+    stream_answer_with_graph_rag,
+)
+from ..rag.answer_cache import answer_cache_stats
+from ..rag.embedding_cache import embedding_cache_stats
+from ..rag.metrics import snapshot
+from ..rag.resilience import breaker_states
 
 
 router = APIRouter(prefix="/ai", tags=["ai"])
@@ -39,6 +50,21 @@ class AIAnswer(BaseModel):
     answer: str
 
 
+class AIHealth(BaseModel):
+    status: Literal["ok", "degraded"]  # degraded while any provider circuit is not closed
+    breakers: Dict[str, str]  # stage -> closed / open / half_open
+    counters: Dict[str, float]  # timeouts, failures, breaker openings/rejections, hedges and hedge wins
+    stages: Dict[str, Dict[str, float]]  # latency summaries (count, p50, p95, p99, max in seconds)
+    # memory/disk hits, misses, writes, evictions and sizes; every hit is an embedding call saved (empty if disabled)
+    embedding_cache: Dict[str, int]
+    answer_cache: Dict[str, int]  # exact hits, semantic hits, misses and entries (empty if disabled)
+
+
+class FarmerQuestionBatch(BaseModel):
+    # e.g. questions collected by extension staff at a village meeting
+    questions: List[FarmerQuestion] = Field(min_length=1, max_length=rag_config.batch_max_questions)
+
+
 @router.post("/farmer", response_model=AIAnswer)
 async def ask_farmer_ai(
     body: FarmerQuestion,
@@ -51,7 +77,7 @@ async def ask_farmer_ai(
 
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only farmers can use this endpoint")
 
-    answer = answer_with_graph_rag(
+    answer = await answer_with_graph_rag_async(
         question=body.question,
         role="farmer",
         use_case=body.use_case,
@@ -70,9 +96,118 @@ async def ask_distributor_ai(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only distributors can use this endpoint")
 
     # Restrict to the two allowed distributor use-cases implied by requirements
-    answer = answer_with_graph_rag(
+    answer = await answer_with_graph_rag_async(
         question=body.question,
         role="distributor",
         use_case=body.use_case,
     )
     return AIAnswer(answer=answer)
+
+
+async def _sse_events(fragments: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Wrap answer fragments as server-sent events.
+
+    Each fragment is sent as `data: {"text": ...}`; the stream ends with an
+    `event: done` (or `event: error`) message.
+    """
+    try:
+        async for text in fragments:
+            yield f"data: {json.dumps({'text': text})}\n\n"
+    except Exception as exc:  # headers are already sent, so report in-band
+        print("[AI] Streaming answer failed:", exc)
+        yield f"event: error\ndata: {json.dumps({'detail': 'Answer generation failed'})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+
+def _sse_response(fragments: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_events(fragments),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/farmer/stream")
+async def stream_farmer_ai(
+    body: FarmerQuestion,
+    current_user: User = Depends(get_current_user),
+):
+    """Same as /ai/farmer, but streams the answer over server-sent events."""
+    if current_user.role != UserRole.FARMER:
+        from fastapi import HTTPException, status
+
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only farmers can use this endpoint")
+
+    return _sse_response(
+        stream_answer_with_graph_rag(question=body.question, role="farmer", use_case=body.use_case)
+    )
+
+
+@router.post("/distributor/stream")
+async def stream_distributor_ai(
+    body: DistributorQuestion,
+    current_user: User = Depends(get_current_user),
+):
+    """Same as /ai/distributor, but streams the answer over server-sent events."""
+    if current_user.role != UserRole.DISTRIBUTOR:
+        from fastapi import HTTPException, status
+
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only distributors can use this endpoint")
+
+    return _sse_response(
+        stream_answer_with_graph_rag(question=body.question, role="distributor", use_case=body.use_case)
+    )
+
+
+async def _sse_batch_events(body: FarmerQuestionBatch) -> AsyncIterator[str]:
+    """One `data: {"index", "question", "answer"}` event per question, in completion order."""
+    items = [(q.question, q.use_case) for q in body.questions]
+    try:
+        async for index, answer in answer_batch_with_graph_rag(items, role="farmer"):
+            payload = {"index": index, "question": items[index][0], "answer": answer}
+            yield f"data: {json.dumps(payload)}\n\n"
+    except Exception as exc:  # headers are already sent, so report in-band
+        print("[AI] Batch answering failed:", exc)
+        yield f"event: error\ndata: {json.dumps({'detail': 'Answer generation failed'})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+
+@router.post("/farmer/batch")
+async def ask_farmer_ai_batch(
+    body: FarmerQuestionBatch,
+    current_user: User = Depends(get_current_user),
+):
+    """Answer up to rag_config.batch_max_questions farmer questions in one request.
+
+    Answers are streamed as server-sent events as soon as each one is ready,
+    so they arrive out of order; use `index` to match them to the questions.
+    """
+    if current_user.role != UserRole.FARMER:
+        from fastapi import HTTPException, status
+
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only farmers can use this endpoint")
+
+    return StreamingResponse(
+        _sse_batch_events(body),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/health", response_model=AIHealth)
+async def ai_health(current_user: User = Depends(get_current_user)):
+    """Provider circuit breaker states, RAG pipeline metrics and cache counters of this process."""
+    breakers = breaker_states()
+    stages = snapshot()
+    counters = stages.pop("counters")
+    status = "ok" if all(state == "closed" for state in breakers.values()) else "degraded"
+    return AIHealth(
+        status=status,
+        breakers=breakers,
+        counters=counters,
+        stages=stages,
+        embedding_cache=embedding_cache_stats(),
+        answer_cache=answer_cache_stats(),
+    )
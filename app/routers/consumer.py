@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
@@ -9,6 +10,8 @@ from ..security import require_role
 from ..repositories.batches import get_batch, _to_batch_schema  # type: ignore
 from ..db_models import BatchDB
 from ..database import get_db
+from ..chain_indexer import batch_trace
+from ..chain_verify import verify_batch
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/consumer", tags=["consumer"])
@@ -35,6 +38,34 @@ class ProductDetail(BaseModel):
     price_breakdown: PriceBreakdown
 
 
+class ChainEventProof(BaseModel):
+    event: str  # contract function, e.g. recordPickup / recordRetailerPrice
+    payload: Dict[str, Any]
+    # queued / submitted / confirmed / reverted / dropped / failed / mismatch
+    status: str
+    tx_hash: Optional[str] = None
+    block_number: Optional[int] = None
+    checked_at: Optional[datetime] = None
+    anchored: bool = False
+    merkle_root: Optional[str] = None
+    proof: Optional[List[List[str]]] = None
+    proof_valid: Optional[bool] = None
+
+
+class ChainVerification(BaseModel):
+    batch_id: str
+    verified: bool  # every recorded event is confirmed on-chain
+    events: List[ChainEventProof]
+
+
+class ChainTraceEvent(BaseModel):
+    name: str
+    args: Dict[str, Any]
+    block_number: int
+    tx_hash: str
+    log_index: int
+
+
 @router.get("/products", response_model=List[ProductCard])
 def list_products(db: Session = Depends(get_db)):
     """List products available to consumers.
@@ -94,4 +125,30 @@ def qr_data(batch_id: int, db: Session = Depends(get_db)):
         "crop_name": batch.crop_name,
         "category": batch.category,
         "retailer_price_per_kg": batch.retailer_price_per_kg,
+        "verify_url": f"/consumer/products/{batch_id}/verify",
     }
+
+
+@router.get("/products/{batch_id}/verify", response_model=ChainVerification)
+def verify_product(batch_id: int, db: Session = Depends(get_db)):
+    """Is this batch's trail (creation, pickup, delivery, price) on-chain?
+
+    Answered from the local receipt/proof cache only; receipts are refreshed
+    against the chain in the background, so a scan never waits on an RPC.
+    """
+    batch = get_batch(db, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return verify_batch(db, batch.batch_id)
+
+
+@router.get("/products/{batch_id}/trace", response_model=List[ChainTraceEvent])
+def product_trace(batch_id: int, db: Session = Depends(get_db)):
+    """Contract events of this batch as read back from the chain by the indexer (no RPC per request)."""
+    batch = get_batch(db, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return [
+        ChainTraceEvent(name=e.name, args=e.args, block_number=e.block_number, tx_hash=e.tx_hash, log_index=e.log_index)
+        for e in batch_trace(db, batch.batch_id)
+    ]
@@ -9,7 +9,8 @@ from ..security import require_role
 from ..models.batch import Batch, BatchStatus
 from ..repositories.batches import list_available_for_distributor, get_batch
 from ..database import get_db
-from app.blockchain import bc_record_pickup, bc_record_delivery
+from app.blockchain import delivery_event, pickup_event
+from app.chain_outbox import enqueue_chain_event
 
 router = APIRouter(prefix="/distributor", tags=["distributor"])
 
@@ -34,16 +35,17 @@ def pickup_batch(
     batch.status = BatchStatus.IN_TRANSIT
     batch.distributor_id = current_distributor.id
 
-    # Blockchain: pickup confirmation (core distributor event)
-    try:
-        bc_record_pickup(
+    # Blockchain: pickup confirmation (core distributor event), sent by the outbox worker
+    enqueue_chain_event(
+        db,
+        pickup_event(
             batch_id=batch.batch_id,
             pickup_dt=datetime.utcnow(),
             vehicle_number="UNKNOWN-VEHICLE",  # TODO: extend API to capture real vehicle no.
             destination="Retailer",  # TODO: replace with actual destination when modeled
-        )
-    except Exception as exc:  # pragma: no cover
-        print("[BC] Failed to record pickup:", exc)
+        ),
+    )
+    db.commit()
 
     return batch
 
@@ -63,15 +65,16 @@ def update_transport_status(
 
     batch.status = status
 
-    # Blockchain: delivery confirmation when batch reaches retailer
+    # Blockchain: delivery confirmation when batch reaches retailer, sent by the outbox worker
     if status == BatchStatus.DELIVERED_TO_RETAILER:
-        try:
-            bc_record_delivery(
+        enqueue_chain_event(
+            db,
+            delivery_event(
                 batch_id=batch.batch_id,
                 arrival_dt=datetime.utcnow(),
                 retailer_id_or_name=str(batch.retailer_id or "retailer"),
-            )
-        except Exception as exc:  # pragma: no cover
-            print("[BC] Failed to record delivery:", exc)
+            ),
+        )
+        db.commit()
 
     return batch
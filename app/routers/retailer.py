@@ -14,7 +14,8 @@ from ..security import require_role
 from ..repositories.alerts import create_alert
 from ..models.alerts import AlertType
 from ..database import get_db
-from app.blockchain import bc_record_retailer_price
+from app.blockchain import retailer_price_event
+from app.chain_outbox import enqueue_chain_event
 
 router = APIRouter(prefix="/retailer", tags=["retailer"])
 
@@ -125,23 +126,24 @@ def update_price(
             message="Abnormal retail price increase detected.",
         )
 
-    # Blockchain: retailer sets / updates selling price (core price event)
     # Persist price and discount into the DB row for consumer visibility
     db_row = db.query(BatchDB).filter(BatchDB.batch_id == batch_id).first()
     if db_row:
         db_row.retailer_price_per_kg = int(price.price_per_kg)
         db_row.retailer_discount_percent = int(discount)
-        db.commit()
 
-    try:
-        bc_record_retailer_price(
+    # Blockchain: retailer sets / updates selling price (core price event), committed with the
+    # price and sent by the outbox worker
+    enqueue_chain_event(
+        db,
+        retailer_price_event(
             batch_id=batch.batch_id,
             original_price=price.price_per_kg,
             discount_percent=discount,
             final_price=final_price,
-        )
-    except Exception as exc:  # pragma: no cover
-        print("[BC] Failed to record retailer price:", exc)
+        ),
+    )
+    db.commit()
 
     return batch
 
@@ -1,10 +1,20 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
+import queue
+import re
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import numpy as np
 from pypdf import PdfReader
 
 # Ensure we can import the FastAPI app package when running as a script
@@ -12,87 +22,618 @@ ROOT_DIR = Path(__file__).resolve().parent
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
-from app.rag.graph_rag import RagChunk, index_chunks  # type: ignore  # noqa: E402
+from app.rag.config import rag_config  # type: ignore  # noqa: E402
+from app.rag.context import estimate_tokens  # type: ignore  # noqa: E402
+from app.rag.graph_rag import RagChunk, delete_chunks, index_chunks, update_chunk_metadata  # type: ignore  # noqa: E402
+from app.rag.embedding_cache import embedding_cache_stats  # type: ignore  # noqa: E402
+from app.rag.answer_cache import invalidate_answer_cache  # type: ignore  # noqa: E402
+from app.rag.concepts import get_concept_graph  # type: ignore  # noqa: E402
+from app.rag.dedup import (  # type: ignore  # noqa: E402
+    NearDuplicateIndex,
+    dedup_params,
+    get_dedup_index,
+    minhash_signature,
+)
+from app.rag.topics import TAGGER_VERSION  # type: ignore  # noqa: E402
 
 
 RESEARCH_DIR = ROOT_DIR / "research_papers"
 
+# Pipeline sizing: extraction runs up to EXTRACT_WORKERS processes with at most
+# MAX_PENDING_FILES PDFs in flight; chunks are flushed to Chroma in batches of
+# INDEX_BATCH_SIZE with at most MAX_PENDING_BATCHES waiting for the indexer.
+EXTRACT_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+MAX_PENDING_FILES = EXTRACT_WORKERS * 2
+INDEX_BATCH_SIZE = 256
+MAX_PENDING_BATCHES = 2
+# Files orphaned by a pass (see find_representative) are re-ingested in the same run, up to this many passes.
+MAX_INGEST_PASSES = 3
 
-def extract_text_from_pdf(path: Path) -> str:
+# Part of every manifest entry: bump when chunking logic changes so all files are re-chunked.
+CHUNKER_VERSION = 2
+CHUNK_TOKENS = 400
+CHUNK_OVERLAP_TOKENS = 50
+
+# (page number starting at 1, page text)
+Page = Tuple[int, str]
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*\.?|[IVX]+\.|[A-Z]\.)\s+\S")
+_HEADING_WORDS = {
+    "abstract", "introduction", "background", "methods", "methodology", "materials and methods",
+    "results", "discussion", "results and discussion", "conclusion", "conclusions",
+    "recommendations", "acknowledgements", "acknowledgments", "references", "summary",
+}
+
+
+def iter_pdf_pages(path: Path) -> Iterator[Page]:
+    """Lazily yield (page number, text) for pages that have text."""
     reader = PdfReader(str(path))
-    texts: List[str] = []
-    for page in reader.pages:
+    for number, page in enumerate(reader.pages, start=1):
         try:
             txt = page.extract_text() or ""
         except Exception:
             txt = ""
-        if txt:
-            texts.append(txt)
-    return "\n".join(texts)
+        if txt.strip():
+            yield number, txt
 
 
-def chunk_text(text: str, max_chars: int = 2000) -> List[str]:
-    """Very simple character-based chunking.
+def extract_pages_from_pdf(path: Path) -> List[Page]:
+    """Return (page number, text) for each page with text.
 
-    For better semantic chunks you can later improve this using paragraphs/sections.
+    Runs inside the extraction process pool, so it must stay a top-level function.
+    """
+    return list(iter_pdf_pages(path))
+
+
+def extract_text_from_pdf(path: Path) -> str:
+    return "\n".join(text for _, text in iter_pdf_pages(path))
+
+
+@dataclass
+class TextChunk:
+    text: str
+    page_start: int
+    page_end: int
+    section: str = ""
+
+
+@dataclass
+class _Unit:
+    """A sentence (or a piece of an over-long one) waiting to be packed into a chunk."""
+
+    text: str
+    page: int
+    tokens: int
+    paragraph_start: bool
+    section: str = ""
+
+
+def _is_heading(line: str) -> bool:
+    if len(line) > 80 or line.endswith((".", ",", ";")):
+        return False
+    if line.lower().rstrip(":") in _HEADING_WORDS:
+        return True
+    words = line.split()
+    if _NUMBERED_HEADING_RE.match(line) and len(words) <= 10:
+        return True
+    return 1 <= len(words) <= 8 and line.isupper() and any(c.isalpha() for c in line)
+
+
+def _iter_blocks(text: str) -> Iterator[Tuple[str, str]]:
+    """Split one page into ("heading" | "paragraph", text) blocks.
+
+    Paragraphs end at blank lines, or at a line that finishes a sentence well
+    short of the page's usual line width. Hyphenated line breaks are joined.
+    """
+    lines = [line.strip() for line in text.replace("\r", "\n").split("\n")]
+    widths = sorted(len(line) for line in lines if line)
+    full_width = widths[int(len(widths) * 0.9)] if widths else 0
+    current: List[str] = []
+
+    def paragraph() -> Iterator[Tuple[str, str]]:
+        if current:
+            joined = ""
+            for part in current:
+                if joined.endswith("-") and part[:1].islower():
+                    joined = joined[:-1] + part
+                else:
+                    joined = f"{joined} {part}" if joined else part
+            current.clear()
+            yield "paragraph", joined
+
+    for line in lines:
+        if not line:
+            yield from paragraph()
+        elif _is_heading(line):
+            yield from paragraph()
+            yield "heading", line.rstrip(":")
+        else:
+            current.append(line)
+            if line.endswith((".", "!", "?", ":")) and len(line) < 0.8 * full_width:
+                yield from paragraph()
+    yield from paragraph()
+
+
+def _unit_tokens(text: str) -> int:
+    return estimate_tokens(text) + 1  # rounding and the separator it is joined with
+
+
+def _split_long(sentence: str, max_tokens: int) -> Iterator[str]:
+    """Pieces of at most max_tokens from a "sentence" longer than a whole chunk (tables, reference lists)."""
+    max_chars = max_tokens * rag_config.chars_per_token - rag_config.chars_per_token
+    piece: List[str] = []
+    size = 0
+    for word in sentence.split():
+        while len(word) > max_chars:
+            yield word[:max_chars]
+            word = word[max_chars:]
+        if piece and size + 1 + len(word) > max_chars:
+            yield " ".join(piece)
+            piece, size = [], 0
+        size += len(word) + (1 if piece else 0)
+        piece.append(word)
+    if piece:
+        yield " ".join(piece)
+
+
+def _iter_units(pages: Iterable[Page], max_tokens: int) -> Iterator[Tuple[str, Any]]:
+    """("heading", text) or ("unit", _Unit) items in document order; no unit exceeds max_tokens."""
+    for page_no, text in pages:
+        for kind, block in _iter_blocks(text):
+            if kind == "heading":
+                yield "heading", block
+                continue
+            first = True
+            for sentence in _SENTENCE_SPLIT_RE.split(block):
+                tokens = _unit_tokens(sentence)
+                pieces = [sentence] if tokens <= max_tokens else _split_long(sentence, max_tokens)
+                for piece in pieces:
+                    yield "unit", _Unit(piece, page_no, _unit_tokens(piece), first)
+                    first = False
+
+
+def iter_chunks(
+    pages: Iterable[Page],
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[TextChunk]:
+    """Stream token-sized chunks from lazily consumed pages.
+
+    Sentences are packed into chunks of at most `max_tokens` (estimated)
+    tokens, preferring to close a chunk at a heading or paragraph boundary
+    once it is reasonably full. Consecutive chunks share up to
+    `overlap_tokens` of trailing sentences. Each chunk carries its page range
+    and the section heading in effect where it starts. Only the chunk being built is held
+    in memory, and every sentence is handled once (plus overlap), so time is
+    linear in the document length.
+    """
+    units: Deque[_Unit] = deque()
+    used = 0
+    section = ""
+    fresh = 0  # units in `units` that were not carried over from the previous chunk
+
+    def build() -> TextChunk:
+        parts: List[str] = []
+        for i, unit in enumerate(units):
+            if i:
+                parts.append("\n" if unit.paragraph_start else " ")
+            parts.append(unit.text)
+        return TextChunk("".join(parts), units[0].page, units[-1].page, units[0].section)
+
+    def emit() -> Iterator[TextChunk]:
+        nonlocal used, fresh
+        if not fresh:
+            return
+        yield build()
+        kept = 0
+        carry: Deque[_Unit] = deque()
+        while units and kept + units[-1].tokens <= overlap_tokens:
+            kept += units[-1].tokens
+            carry.appendleft(units.pop())
+        units.clear()
+        units.extend(carry)
+        used, fresh = kept, 0
+
+    for kind, item in _iter_units(pages, max_tokens):
+        if kind == "heading":
+            if fresh and used >= max_tokens // 4:
+                yield from emit()
+            # Never carry overlap across a section boundary; a short unfinished tail
+            # (e.g. a caption) is kept and joins the new section's first chunk.
+            while len(units) > fresh:
+                used -= units.popleft().tokens
+            section = item
+            continue
+        boundary = item.paragraph_start and used >= max_tokens * 3 // 4
+        if used + item.tokens > max_tokens or boundary:
+            yield from emit()
+            while units and used + item.tokens > max_tokens:  # overlap + item must still fit
+                used -= units.popleft().tokens
+        item.section = section
+        units.append(item)
+        used += item.tokens
+        fresh += 1
+    yield from emit()
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    return [c.text for c in iter_chunks([(1, text)], max_tokens, overlap_tokens)]
+
+
+def iter_pdf_chunks(pdf_path: Path, pages: Iterable[Page]) -> Iterator[RagChunk]:
+    base_id = pdf_path.stem.replace(" ", "_")
+    for idx, chunk in enumerate(iter_chunks(pages), start=1):
+        chunk_id = f"{base_id}_chunk_{idx}"
+        metadata = {
+            "source_file": pdf_path.name,
+            "chunk_index": idx,
+            "page_start": chunk.page_start,
+            "page_end": chunk.page_end,
+        }
+        if chunk.section:
+            metadata["section"] = chunk.section
+        yield RagChunk(id=chunk_id, text=chunk.text, metadata=metadata)
+
+
+def iter_extracted(
+    pdf_files: List[Path], workers: int, max_pending: int
+) -> Iterator[Tuple[Path, Optional[List[Page]]]]:
+    """Extract PDFs in a process pool, yielding results in input order.
+
+    Pages are None when the file could not be read at all.
+
+    At most `max_pending` files are submitted ahead of the consumer, so a slow
+    consumer (chunking/indexing) throttles extraction instead of letting page
+    text pile up in memory.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: Deque[Tuple[Path, Future]] = deque()
+        files = iter(pdf_files)
+        for pdf_path in files:
+            pending.append((pdf_path, pool.submit(extract_pages_from_pdf, pdf_path)))
+            if len(pending) >= max_pending:
+                break
+        while pending:
+            pdf_path, future = pending.popleft()
+            next_path = next(files, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(extract_pages_from_pdf, next_path)))
+            try:
+                pages = future.result()
+            except Exception as exc:
+                print(f"[WARN] Failed to read {pdf_path.name}: {exc}")
+                pages = None
+            yield pdf_path, pages
+
+
+def chunking_params() -> Dict[str, Any]:
+    return {
+        "chunker_version": CHUNKER_VERSION,
+        "max_tokens": CHUNK_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "chars_per_token": rag_config.chars_per_token,
+        "tagger_version": TAGGER_VERSION,
+        "dedup": dedup_params(),
+    }
+
+
+# Indexes every ingested chunk is written to; files indexed before one was added get re-ingested.
+INDEX_TARGETS = ["chroma", "numpy", "bm25", "concepts", "dedup"]
+
+
+def find_representative(
+    dedup: NearDuplicateIndex,
+    chunk: RagChunk,
+    previous: Dict[str, np.ndarray],
+    orphaned: Set[str],
+) -> Optional[str]:
+    """ID of an already-seen chunk this one nearly duplicates (recording it as an alias), else None.
+
+    Chunks without a near-duplicate become representatives for later chunks.
+    Chunk IDs are positional, so a changed file reuses them for different
+    text: when `previous` (the file's signatures before this ingest) shows
+    that the chunk's ID held other text, the aliases recorded against it are
+    released and their files added to `orphaned`.
+    """
+    signature = minhash_signature(chunk.text)
+    old = previous.get(chunk.id)
+    if old is not None and (signature is None or old.tobytes() != signature.tobytes()):
+        orphaned |= dedup.release(chunk.id)
+    if signature is None:
+        return None
+    source_file = chunk.metadata.get("source_file", "")
+    representative = dedup.find(signature)
+    if representative is not None and representative != chunk.id:
+        alias = {k: v for k, v in chunk.metadata.items() if k in ("source_file", "page_start", "page_end", "section")}
+        dedup.add_alias(chunk.id, representative, source_file, alias)
+        return representative
+    dedup.add(chunk.id, source_file, signature)
+    return None
+
+
+def duplicate_metadata(dedup: NearDuplicateIndex, representative_ids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """Metadata naming the near-duplicates dropped in favour of each representative.
+
+    Chroma metadata values must be scalars, so the alias IDs and their source
+    files are stored comma-separated (empty when a representative has none).
+    """
+    return {
+        rid: {
+            "duplicate_ids": ",".join(alias_id for alias_id, _ in found),
+            "duplicate_sources": ",".join(sorted({source for _, source in found})),
+        }
+        for rid, found in dedup.aliases_of(sorted(set(representative_ids))).items()
+    }
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    """JSON record of what has been indexed, one entry per PDF file name.
+
+    Each entry holds the file's sha256, size/mtime (to skip re-hashing files
+    that were not touched), the chunking parameters, the chunk IDs it
+    produced in Chroma and the chunks skipped as near-duplicates (alias ID ->
+    representative ID).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            try:
+                self.files = json.loads(path.read_text()).get("files", {})
+            except (OSError, ValueError) as exc:
+                print(f"[WARN] Ignoring unreadable manifest {path}: {exc}")
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"files": self.files}, indent=1, sort_keys=True))
+        os.replace(tmp, self.path)  # atomic, so a crash never leaves a torn manifest
+
+    def fingerprint(self, pdf_path: Path) -> Dict[str, Any]:
+        """Content fingerprint of a file, reusing the stored hash if size and mtime match."""
+        stat = pdf_path.stat()
+        entry = self.files.get(pdf_path.name)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            sha = entry["sha256"]
+        else:
+            sha = file_sha256(pdf_path)
+        return {
+            "sha256": sha,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunking": chunking_params(),
+            "indexes": INDEX_TARGETS,
+        }
+
+    def invalidate(self, names: Iterable[str]) -> None:
+        """Force files to be re-ingested on the next run (their chunk IDs are kept for cleanup)."""
+        for name in names:
+            if name in self.files:
+                print(f"[INGEST] {name} lost the representative of a near-duplicate chunk, re-ingesting.")
+                self.files[name]["invalidated"] = True
+
+    def is_current(self, pdf_path: Path, fingerprint: Dict[str, Any]) -> bool:
+        entry = self.files.get(pdf_path.name)
+        return bool(
+            entry
+            and not entry.get("invalidated")
+            and entry.get("sha256") == fingerprint["sha256"]
+            and entry.get("chunking") == fingerprint["chunking"]
+            and entry.get("indexes") == fingerprint["indexes"]
+        )
+
+
+# (file name, manifest entry) pairs for files whose chunks have all been handed to the indexer
+CompletedFiles = List[Tuple[str, Dict[str, Any]]]
+# chunk ID -> metadata keys to merge into an already indexed chunk
+MetadataUpdates = Dict[str, Dict[str, str]]
+
+
+class _Indexer(threading.Thread):
+    """Background stage that drains chunk batches from a bounded queue into Chroma."""
+
+    def __init__(self, max_pending_batches: int, manifest: IngestManifest) -> None:
+        super().__init__(name="ingest-indexer", daemon=True)
+        self.batches: "queue.Queue[Optional[Tuple[List[RagChunk], CompletedFiles, MetadataUpdates]]]" = queue.Queue(
+            maxsize=max_pending_batches
+        )
+        self.manifest = manifest
+        self.indexed = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        while True:
+            item = self.batches.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the producer never blocks forever
+            batch, completed, updates = item
+            try:
+                index_chunks(batch)
+                # Targets chunks of this or an earlier batch, so they are indexed by now
+                update_chunk_metadata(updates)
+                self.indexed += len(batch)
+                # Files whose last chunk is in this (or an earlier) batch are now fully indexed
+                for name, entry in completed:
+                    stale = set(self.manifest.files.get(name, {}).get("chunk_ids", [])) - set(entry["chunk_ids"])
+                    delete_chunks(sorted(stale))
+                    self.manifest.files[name] = entry
+                    self.manifest.invalidate(get_dedup_index().delete(sorted(stale)))
+                if completed:
+                    self.manifest.save()
+            except BaseException as exc:
+                self.error = exc
+
+    def submit(self, batch: List[RagChunk], completed: CompletedFiles, updates: MetadataUpdates) -> None:
+        if self.error is not None:
+            raise self.error
+        self.batches.put((batch, completed, updates))  # blocks while the queue is full (back-pressure)
+
+    def finish(self) -> None:
+        self.batches.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+def ingest_all_papers(
+    workers: int = EXTRACT_WORKERS,
+    batch_size: int = INDEX_BATCH_SIZE,
+) -> None:
+    """Incrementally sync research_papers/ into Chroma.
+
+    Files whose content hash and chunking parameters match the manifest are
+    skipped; new or changed files are re-chunked and upserted (dropping chunk
+    IDs they no longer produce); files that disappeared have their chunks
+    deleted.
     """
-    text = text.replace("\r", "\n")
-    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
-
-    chunks: List[str] = []
-    start = 0
-    while start < len(text):
-        end = min(start + max_chars, len(text))
-        # Try to cut at last sentence boundary within the window
-        window = text[start:end]
-        last_dot = window.rfind(". ")
-        if last_dot != -1 and end < len(text):
-            end = start + last_dot + 1
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        start = end
-    return chunks
-
-
-def ingest_all_papers() -> None:
     if not RESEARCH_DIR.exists():
         print(f"research_papers directory not found at: {RESEARCH_DIR}")
         return
 
+    manifest = IngestManifest(Path(rag_config.ingest_manifest_path))
     pdf_files = sorted(RESEARCH_DIR.glob("*.pdf"))
-    if not pdf_files:
-        print("No PDF files found in research_papers directory.")
+
+    removed = sorted(set(manifest.files) - {p.name for p in pdf_files})
+    for name in removed:
+        print(f"[INGEST] {name} was removed, deleting its chunks.")
+        chunk_ids = manifest.files.pop(name).get("chunk_ids", [])
+        delete_chunks(chunk_ids)
+        manifest.invalidate(get_dedup_index().delete(chunk_ids))
+        touched = get_dedup_index().forget_file(name)
+        if rag_config.dedup_enabled:
+            update_chunk_metadata(duplicate_metadata(get_dedup_index(), touched))
+    if removed:
+        manifest.save()
+
+    passes = 0
+    while True:
+        fingerprints = {p.name: manifest.fingerprint(p) for p in pdf_files}
+        to_ingest = [p for p in pdf_files if not manifest.is_current(p, fingerprints[p.name])]
+        if passes == 0:
+            print(f"[INGEST] {len(pdf_files)} PDFs: {len(to_ingest)} new/changed, {len(removed)} removed.")
+        elif to_ingest:
+            print(f"[INGEST] Re-ingesting {len(to_ingest)} file(s) that lost near-duplicate representatives.")
+        if not to_ingest:
+            break
+        if passes == MAX_INGEST_PASSES:
+            print(f"[WARN] {len(to_ingest)} file(s) still invalidated after {passes} passes, left for the next run.")
+            break
+        _ingest_pass(manifest, to_ingest, fingerprints, workers, batch_size)
+        passes += 1
+
+    if not passes:
+        if removed:
+            invalidate_answer_cache()
+        print("[INGEST] Nothing to index.")
         return
 
-    all_chunks: List[RagChunk] = []
+    # Cached answers were generated from the old corpus
+    invalidate_answer_cache()
+    graph = get_concept_graph().stats()
+    print(f"[INGEST] Concept graph: {graph['concepts']} concepts, {graph['edges']} edges.")
+    stats = embedding_cache_stats()
+    if stats:
+        print(f"[INGEST] Embedding cache: {stats['hits']} hits, {stats['misses']} misses.")
+    print("[INGEST] Done.")
 
-    for pdf_path in pdf_files:
-        print(f"[INGEST] Reading {pdf_path.name}...")
-        full_text = extract_text_from_pdf(pdf_path)
-        if not full_text.strip():
-            print(f"[WARN] No text extracted from {pdf_path.name}, skipping.")
-            continue
 
-        text_chunks = chunk_text(full_text)
-        print(f"[INGEST] {pdf_path.name}: {len(text_chunks)} chunks.")
+def _ingest_pass(
+    manifest: IngestManifest,
+    to_ingest: List[Path],
+    fingerprints: Dict[str, Dict[str, Any]],
+    workers: int,
+    batch_size: int,
+) -> None:
+    """Chunk and index the given files; files orphaned on the way are invalidated in the manifest."""
+    started = time.perf_counter()
+    indexer = _Indexer(MAX_PENDING_BATCHES, manifest)
+    indexer.start()
 
-        base_id = pdf_path.stem.replace(" ", "_")
-        for idx, chunk in enumerate(text_chunks, start=1):
-            chunk_id = f"{base_id}_chunk_{idx}"
-            metadata = {
-                "source_file": pdf_path.name,
-                "chunk_index": idx,
-            }
-            all_chunks.append(RagChunk(id=chunk_id, text=chunk, metadata=metadata))
+    dedup = get_dedup_index() if rag_config.dedup_enabled else None
+    batch: List[RagChunk] = []
+    completed: CompletedFiles = []
+    updates: MetadataUpdates = {}
+    orphaned: Set[str] = set()
+    produced = 0
+    duplicates = 0
+    files_done = 0
 
-    if not all_chunks:
-        print("[INGEST] No chunks to index.")
-        return
+    def report() -> None:
+        elapsed = time.perf_counter() - started
+        rate = indexer.indexed / elapsed if elapsed else 0.0
+        print(
+            f"[INGEST] {files_done}/{len(to_ingest)} files, {produced} chunks produced, "
+            f"{indexer.indexed} indexed ({rate:.1f} chunks/s), {duplicates} near-duplicates skipped"
+        )
 
-    print(f"[INGEST] Indexing {len(all_chunks)} chunks into Chroma...")
-    index_chunks(all_chunks)
-    print("[INGEST] Done.")
+    def flush() -> None:
+        nonlocal batch, completed, updates, produced
+        # Representatives still in this batch get their duplicate metadata before index_chunks
+        for chunk in batch:
+            chunk.metadata.update(updates.pop(chunk.id, {}))
+        indexer.submit(batch, completed, updates)
+        produced += len(batch)
+        batch, completed, updates = [], [], {}
+        report()
+
+    try:
+        for pdf_path, pages in iter_extracted(to_ingest, workers, max(MAX_PENDING_FILES, workers)):
+            files_done += 1
+            if pages is None:
+                continue  # not recorded in the manifest, so the next run retries it
+            if not pages:
+                print(f"[WARN] No text extracted from {pdf_path.name}, skipping.")
+
+            chunk_ids: List[str] = []
+            aliases: Dict[str, str] = {}
+            previous: Dict[str, np.ndarray] = {}
+            touched: Set[str] = set()
+            orphaned.discard(pdf_path.name)  # being re-ingested now, so its aliases are rebuilt anyway
+            if dedup is not None:
+                previous = dedup.signatures(pdf_path.name)
+                touched = dedup.forget_file(pdf_path.name)  # its previous chunks must not count as duplicates
+            for chunk in iter_pdf_chunks(pdf_path, pages):
+                representative = (
+                    find_representative(dedup, chunk, previous, orphaned) if dedup is not None else None
+                )
+                if representative is not None:
+                    aliases[chunk.id] = representative
+                    continue
+                batch.append(chunk)
+                chunk_ids.append(chunk.id)
+                if len(batch) >= batch_size:
+                    flush()
+            if dedup is not None:
+                dedup.commit()
+                # The file's own chunks are re-indexed with fresh metadata, and the
+                # representatives it aliased (or no longer aliases) changed
+                updates.update(duplicate_metadata(dedup, touched | set(aliases.values()) | set(chunk_ids)))
+            duplicates += len(aliases)
+            print(f"[INGEST] {pdf_path.name}: {len(chunk_ids)} chunks, {len(aliases)} near-duplicates skipped.")
+            entry = {**fingerprints[pdf_path.name], "chunk_ids": chunk_ids, "aliases": aliases}
+            completed.append((pdf_path.name, entry))
+
+        if batch or completed:
+            flush()
+    finally:
+        indexer.finish()
+    report()
+    # Applied once the indexer is done, so a queued manifest entry cannot overwrite the flag
+    if orphaned:
+        manifest.invalidate(sorted(orphaned))
+        manifest.save()
 
 
 if __name__ == "__main__":